@@ -9,11 +9,13 @@ from donky.exceptions import (
     PartialBackupError,
     BackupNotFoundError
 )
+from donky.integrity import check_backup_files
 
 SUPPORTED_BACKUP_TYPES = [
     "binary",
 ]
 DEFAUL_IMAGE = "percona/percona-server"
+COMPRESSION_RATIO = 3
 
 
 def format_search(name: str, suffix: str) -> str:
@@ -42,25 +44,72 @@ def find_files_by_pattern(path: str, pattern: str) -> list:
     return files
 
 
-def binary_backup_info(path: str) -> dict:
-    files = find_files_by_pattern(path=path, pattern="xtrabackup_info")
-    file = find_newest_file(files=files)
+def read_backup_info(file: str) -> dict:
+    """
+    Parse xtrabackup_info file
+    """
     backup_info_parser = configparser.ConfigParser()
     with open(file, "r") as f:
         backup_info_parser.read_string("[backup_info]\n" + f.read())
     backup_info: dict = backup_info_parser.__dict__.get("_sections")["backup_info"]
-    if backup_info.get("encrypted") != "N":
-        raise BackupEncryptedError("Encrypted backups currently not supported")
-    if backup_info.get("incremental") != "N":
-        raise IncrementalBackupError("Incremental backups currently not supported")
-    if backup_info.get("partial") != "N":
-        raise PartialBackupError("Partial backup not supported")
+    backup_info["backup_info_file"] = file
+    return backup_info
+
+
+def backup_lsn(backup_info: dict, name: str) -> int:
+    """
+    Get from/to lsn from backup info
+    """
+    lsn = backup_info.get(f"innodb_{name}", backup_info.get(name))
+    if lsn is None:
+        raise IncrementalBackupError(f"Backup {backup_info['backup_info_file']} has no {name}")
+    return int(lsn)
+
+
+def incremental_chain(full: dict, backups: list) -> list:
+    """
+    Follow from_lsn/to_lsn from full backup to newest incremental,
+    every backup is used once, so incrementals without writes
+    (from_lsn equal to to_lsn) don't loop
+    """
+    chain = []
+    used = set()
+    to_lsn = backup_lsn(backup_info=full, name="to_lsn")
+    while True:
+        found = [
+            b for b in backups
+            if b["backup_info_file"] not in used and backup_lsn(backup_info=b, name="from_lsn") == to_lsn]
+        if len(found) == 0:
+            return chain
+        backup = max(found, key=lambda b: os.path.getctime(b["backup_info_file"]))
+        if backup_lsn(backup_info=backup, name="to_lsn") < to_lsn:
+            raise IncrementalBackupError(f"Backup {backup['backup_info_file']} to_lsn is lower than from_lsn")
+        used.add(backup["backup_info_file"])
+        chain.append(backup)
+        to_lsn = backup_lsn(backup_info=backup, name="to_lsn")
+
+
+def binary_backup_info(path: str) -> dict:
+    files = find_files_by_pattern(path=path, pattern="xtrabackup_info")
+    backups = [read_backup_info(file=f) for f in files]
+    fulls = [b for b in backups if b.get("incremental") == "N"]
+    if len(fulls) == 0:
+        raise BackupNotFoundError(f"No full backup found in {path}")
+    backup_info = max(fulls, key=lambda b: os.path.getctime(b["backup_info_file"]))
+    incrementals = [b for b in backups if b.get("incremental") != "N"]
+    chain = incremental_chain(full=backup_info, backups=incrementals)
+    for backup in [backup_info] + chain:
+        if backup.get("encrypted") != "N":
+            raise BackupEncryptedError("Encrypted backups currently not supported")
+        if backup.get("partial") != "N":
+            raise PartialBackupError("Partial backup not supported")
     format: str = backup_info.get("format")
     compressed = True if backup_info.get("compressed") == "compressed" else False
     server_version = ".".join(backup_info.get("server_version").split(".")[:2])
     tool_version = ".".join(backup_info.get("tool_version").split(".")[:2])
     backup_info = {
-        "backup_info_file": file,
+        "backup_info_file": backup_info["backup_info_file"],
+        "incremental_info_files": [b["backup_info_file"] for b in chain],
         "server_version": server_version,
         "tool_version": tool_version,
         "format": format,
@@ -79,18 +128,36 @@ def binary_backup_file(path: str, format: str, name: str) -> str:
     return backup_file[0]
 
 
+def estimate_restored_size(files: list, compressed: bool) -> int:
+    """
+    Estimate restored datadir size from backup files size,
+    xtrabackup_info doesn't record it
+    """
+    size = sum(os.path.getsize(f) for f in files)
+    return size * COMPRESSION_RATIO if compressed else size
+
+
 def binary_backups(path: str, pattern: str) -> dict:
     results = binary_backup_info(path=path)
-    location = results.pop("backup_info_file").rstrip("/xtrabackup_info")
+    location = os.path.dirname(results.pop("backup_info_file"))
     format = results.get("format")
     results["backup_file"] = binary_backup_file(path=location, format=format, name=pattern)
+    results["incremental_files"] = [
+        binary_backup_file(path=os.path.dirname(f), format=format, name=pattern)
+        for f in results.pop("incremental_info_files")
+    ]
+    results["restored_size"] = estimate_restored_size(
+        files=[results["backup_file"]] + results["incremental_files"],
+        compressed=results["compressed"])
     return results
 
 
 def resolve_backup(
         backup_type: str,
         backup_path: str,
-        name_pattern: str) -> dict:
+        name_pattern: str,
+        threads: int = 4,
+        cache_file: str = None) -> dict:
     _logger = logging.getLogger("Donky")
     _logger.info(f"Resolving backup type: {backup_type}")
     if backup_type not in SUPPORTED_BACKUP_TYPES:
@@ -98,6 +165,11 @@ def resolve_backup(
     if not os.path.isdir(backup_path):
         raise ValueError(f"Backup path {backup_path} not a directory")
     backup_info = binary_backups(path=backup_path, pattern=name_pattern)
+    check_backup_files(
+        files=[backup_info["backup_file"]] + backup_info["incremental_files"],
+        format=backup_info["format"],
+        threads=threads,
+        cache_file=cache_file)
     _logger.debug(f"Backup info:\n{json.dumps(backup_info, indent=2)}")
     backup_info["image"] = DEFAUL_IMAGE
     return backup_info
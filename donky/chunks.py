@@ -0,0 +1,277 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import numpy
+import sqlalchemy
+from donky.planner import SYSTEM_SCHEMAS
+from donky.transforms import HASH_VERSION, transform_batch
+from donky.verify import quote_table, stream_rows
+
+DEFAULT_CHUNK_SIZE = 100000
+MANIFEST_FILE = "manifest.json"
+WHOLE_TABLE_CHUNK = "all"
+ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\0": "\\0"})
+INTEGER_TYPES = [
+    "tinyint",
+    "smallint",
+    "mediumint",
+    "int",
+    "bigint"
+]
+
+
+def user_tables(conn: sqlalchemy.engine.Connection) -> list:
+    """
+    Get all user tables as <schema>.<table>
+    """
+    query = """
+        SELECT table_schema, table_name
+        FROM information_schema.tables
+        WHERE table_type = 'BASE TABLE'
+        ORDER BY table_schema, table_name
+        """
+    tables = []
+    for row in conn.execute(sqlalchemy.text(query)):
+        if row[0] in SYSTEM_SCHEMAS:
+            continue
+        tables.append(f"{row[0]}.{row[1]}")
+    return tables
+
+
+def table_columns(conn: sqlalchemy.engine.Connection, table: str) -> list:
+    """
+    Get table columns in ordinal order
+    """
+    schema, name = table.split(".", 1)
+    query = """
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = :schema AND table_name = :name
+        ORDER BY ordinal_position
+        """
+    return [row[0] for row in conn.execute(sqlalchemy.text(query), {"schema": schema, "name": name})]
+
+
+def primary_key(conn: sqlalchemy.engine.Connection, table: str) -> str:
+    """
+    Get single column integer primary key, None if table doesn't have one
+    """
+    schema, name = table.split(".", 1)
+    query = """
+        SELECT k.column_name, c.data_type
+        FROM information_schema.key_column_usage k
+        JOIN information_schema.columns c
+          ON c.table_schema = k.table_schema
+         AND c.table_name = k.table_name
+         AND c.column_name = k.column_name
+        WHERE k.table_schema = :schema AND k.table_name = :name AND k.constraint_name = 'PRIMARY'
+        """
+    rows = conn.execute(sqlalchemy.text(query), {"schema": schema, "name": name}).fetchall()
+    if len(rows) != 1 or rows[0][1] not in INTEGER_TYPES:
+        return None
+    return rows[0][0]
+
+
+def chunk_condition(pk: str, chunk: str, chunk_size: int) -> str:
+    """
+    SQL condition selecting rows of chunk
+    """
+    if chunk == WHOLE_TABLE_CHUNK:
+        return "1=1"
+    start = int(chunk) * chunk_size
+    return f"`{pk}` BETWEEN {start} AND {start + chunk_size - 1}"
+
+
+def chunks_condition(pk: str, chunks: list, chunk_size: int) -> str:
+    """
+    SQL condition selecting rows of all chunks,
+    consecutive chunks are merged to one range
+    """
+    if WHOLE_TABLE_CHUNK in chunks:
+        return "1=1"
+    ranges = []
+    for chunk in sorted(int(c) for c in chunks):
+        if ranges and ranges[-1][1] == chunk - 1:
+            ranges[-1][1] = chunk
+        else:
+            ranges.append([chunk, chunk])
+    return " OR ".join(f"`{pk}` BETWEEN {low * chunk_size} AND {(high + 1) * chunk_size - 1}" for low, high in ranges)
+
+
+def pk_chunks(
+        conn: sqlalchemy.engine.Connection,
+        table: str,
+        pk: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE) -> list:
+    """
+    List primary key chunks which hold rows, read from primary key index,
+    so sparse keys don't produce empty chunks.
+    Tables without integer primary key are one chunk
+    """
+    if pk is None:
+        return [WHOLE_TABLE_CHUNK]
+    query = f"SELECT DISTINCT FLOOR(`{pk}` / {chunk_size}) AS chunk FROM {quote_table(table)} ORDER BY chunk"
+    return [str(row[0]) for row in conn.execute(sqlalchemy.text(query))]
+
+
+def chunk_checksums(
+        conn: sqlalchemy.engine.Connection,
+        table: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Checksum table in primary key ranges with one scan,
+    tables without integer primary key are one chunk
+    """
+    pk = primary_key(conn=conn, table=table)
+    columns = table_columns(conn=conn, table=table)
+    row = ", ".join([f"`{c}`" for c in columns] + [f"ISNULL(`{c}`)" for c in columns])
+    chunk = f"FLOOR(`{pk}` / {chunk_size})" if pk is not None else f"'{WHOLE_TABLE_CHUNK}'"
+    query = f"""
+        SELECT {chunk} AS chunk, COUNT(*) AS row_count, BIT_XOR(CRC32(CONCAT_WS('#', {row}))) AS checksum
+        FROM {quote_table(table)}
+        GROUP BY chunk
+        """
+    chunks = {}
+    for result in conn.execute(sqlalchemy.text(query)):
+        chunks[str(result[0])] = {"rows": int(result[1]), "checksum": int(result[2] or 0)}
+    return {"primary_key": pk, "chunks": chunks}
+
+
+def rules_hash(files: list = None, spec: str = None, key: str = None, seed: str = None) -> str:
+    """
+    Hash rule set with transform key, seed and hash version, so chunks
+    are reused only when they would be transformed the same way
+    """
+    digest = hashlib.sha256()
+    for file in files or []:
+        with open(file, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    for value in (spec, key, seed, HASH_VERSION):
+        digest.update(hashlib.sha256((value or "").encode()).digest())
+    return digest.hexdigest()
+
+
+def latest_run(output_dir: str) -> str:
+    """
+    Find newest run directory with manifest
+    """
+    if not os.path.isdir(output_dir):
+        return None
+    runs = [os.path.join(output_dir, d) for d in os.listdir(output_dir)]
+    runs = [r for r in runs if os.path.isfile(os.path.join(r, MANIFEST_FILE))]
+    if len(runs) == 0:
+        return None
+    return max(runs)
+
+
+def read_manifest(run_dir: str) -> dict:
+    if run_dir is None:
+        return None
+    with open(os.path.join(run_dir, MANIFEST_FILE), "r") as file:
+        return json.load(file)
+
+
+def write_manifest(run_dir: str, manifest: dict) -> None:
+    with open(os.path.join(run_dir, MANIFEST_FILE), "w") as file:
+        json.dump(manifest, file, indent=2)
+
+
+def new_run_dir(output_dir: str) -> str:
+    run_dir = os.path.join(output_dir, time.strftime("%Y%m%d%H%M%S"))
+    os.makedirs(run_dir)
+    return run_dir
+
+
+def unchanged_chunks(manifest: dict, previous: dict) -> dict:
+    """
+    Compare manifest with previous run manifest,
+    returns unchanged chunks per table
+    """
+    unchanged = {}
+    if previous is None:
+        return unchanged
+    if previous.get("rules_hash") != manifest["rules_hash"] or previous.get("chunk_size") != manifest["chunk_size"]:
+        return unchanged
+    for table, current in manifest["tables"].items():
+        before = previous["tables"].get(table)
+        if before is None or before["primary_key"] != current["primary_key"]:
+            continue
+        chunks = [c for c, v in current["chunks"].items() if before["chunks"].get(c) == v]
+        if chunks:
+            unchanged[table] = chunks
+    return unchanged
+
+
+def chunk_file(run_dir: str, table: str, chunk: str) -> str:
+    return os.path.join(run_dir, table, f"{chunk}.tsv")
+
+
+def copy_chunk(previous_dir: str, run_dir: str, table: str, chunk: str) -> None:
+    """
+    Reuse chunk output from previous run
+    """
+    source = chunk_file(run_dir=previous_dir, table=table, chunk=chunk)
+    target = chunk_file(run_dir=run_dir, table=table, chunk=chunk)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _format_text(value) -> str:
+    return str(value).translate(ESCAPES)
+
+
+def _format_binary(value) -> str:
+    return bytes(value).decode("utf-8", "surrogateescape").translate(ESCAPES)
+
+
+def format_column(values: numpy.ndarray) -> numpy.ndarray:
+    """
+    Format column for LOAD DATA INFILE default format, binary values
+    are kept byte for byte as surrogate escapes of output encoding
+    """
+    values = numpy.asarray(values)
+    if values.dtype != object:
+        return numpy.char.translate(values.astype(str), ESCAPES).astype(object)
+    nulls = numpy.equal(values, None)
+    present = values[~nulls]
+    result = numpy.full(len(values), "\\N", dtype=object)
+    if len(present) == 0:
+        return result
+    binary = isinstance(present[0], (bytes, bytearray, memoryview))
+    result[~nulls] = numpy.frompyfunc(_format_binary if binary else _format_text, 1, 1)(present)
+    return result
+
+
+def export_chunk(
+        conn: sqlalchemy.engine.Connection,
+        table: str,
+        condition: str,
+        path: str,
+        rules: list,
+        key: str,
+        seed: str) -> int:
+    """
+    Export chunk rows through transform rules to tab separated file
+    """
+    columns = table_columns(conn=conn, table=table)
+    select = ", ".join(f"`{c}`" for c in columns)
+    query = f"SELECT {select} FROM {quote_table(table)} WHERE {condition}"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rows = 0
+    with open(path, "w", encoding="utf-8", errors="surrogateescape", newline="\n") as file:
+        for batch in stream_rows(conn=conn, query=query):
+            data = {c: batch[:, i] for i, c in enumerate(columns)}
+            if rules:
+                data = transform_batch(table=table, batch=data, rules=rules, key=key, seed=seed)
+            lines = functools.reduce(lambda a, b: a + "\t" + b, (format_column(data[c]) for c in columns))
+            file.write("\n".join(lines) + "\n")
+            rows += len(batch)
+    logging.getLogger("Donky").trace(f"Exported {rows} rows to {path}")
+    return rows
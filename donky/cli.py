@@ -1,14 +1,15 @@
 import argparse
 import json
-from donky.obfuscator import Obfuscator
-from donky.containers import Container
 from donky.config import (
     parse_config,
     Donky,
     Obfuscators
 )
-from donky.helpers import create_mysql_container, restore_backup
-from donky.backups import resolve_backup
+from donky.planner import format_plan
+from donky.runner import init_obfuscator, run_obfuscator
+from donky.daemon import DonkyDaemon
+from donky.jobqueue import JobQueue, Worker
+from donky.exceptions import LeakDetectedError
 import time
 import logging
 
@@ -45,11 +46,6 @@ def command(args=[], parent=subparsers, cmd_aliases=None):
     return decorator
 
 
-def update_obfuscator(obfuscator: Obfuscator, data: dict) -> None:
-    for key, value in data.items():
-        obfuscator.__setattr__(key, value)
-
-
 @command(
     [
         argument(
@@ -69,35 +65,168 @@ def obfuscate(args: argparse.Namespace) -> None:
         return
     if args.obfuscator not in config.obfuscators.keys():
         raise ValueError(f"No config section for {args.obfuscator}")
-    _logger.info(f"Obfuscating {args.obfuscator}")
     obfuscator: Obfuscators = config.obfuscators.pop(args.obfuscator)
-    _logger.trace(f"Obfuscator:\n{json.dumps(obfuscator.__dict__, indent=2)}")
-    mysql_con_name = f"mysql_{args.obfuscator}"
-    _logger.info("Resolving backup")
-    backup = resolve_backup(
-            backup_type=obfuscator.backup_type,
-            backup_path=obfuscator.backup_source,
-            name_pattern=obfuscator.search_name)
-    update_obfuscator(obfuscator=obfuscator, data=backup)
-    _logger.debug(f"Obfuscator:\n{json.dumps(obfuscator.__dict__, indent=2)}")
-    _logger.info("Creating mysql container")
-    mysql_container = create_mysql_container(
-            name=mysql_con_name,
-            engine=config.container_engine,
-            con_data=obfuscator.__dict__)
-    mysql_container.stop()
-    _logger.info("Creating xtrbakuo container")
-    restore = restore_backup(
-            name=f"xtrabackup_{args.obfuscator}",
-            backup_file=obfuscator.backup_file,
-            volumes_from=mysql_con_name,
-            version=obfuscator.tool_version,
-            registry=obfuscator.registry,
-            engine=config.container_engine)
-    _logger.debug("Starting backup restore")
-    restore.start()
-    restore.wait(state="exited")
-    _logger.debug("Restore finished")
+    run_obfuscator(config=config, name=args.obfuscator, obfuscator=obfuscator)
+
+
+@command(
+    [
+        argument(
+            "obfuscator",
+            help="Section from config file which to plan"
+        )
+    ]
+)
+def plan(args: argparse.Namespace) -> None:
+    """
+    Estimate statements cost and print execution plan without executing it
+    """
+    config = parse_config(args.config)
+    _logger = logging.getLogger("Donky")
+    if args.obfuscator not in config.obfuscators.keys():
+        raise ValueError(f"No config section for {args.obfuscator}")
+    _logger.info(f"Planning {args.obfuscator}")
+    obfuscator: Obfuscators = config.obfuscators.pop(args.obfuscator)
+    db_obfuscator = init_obfuscator(config=config, name=args.obfuscator, obfuscator=obfuscator)
+    for line in format_plan(db_obfuscator.plan()):
+        _logger.info(line)
+
+
+@command(
+    [
+        argument(
+            "obfuscator",
+            help="Section from config file which to verify"
+        ),
+        argument(
+            "--sample",
+            help="Sample original sensitive values, run before obfuscation rules",
+            action="store_true"
+        )
+    ]
+)
+def verify(args: argparse.Namespace) -> None:
+    """
+    Check obfuscated database for leaked sensitive values
+    """
+    config = parse_config(args.config)
+    _logger = logging.getLogger("Donky")
+    if args.obfuscator not in config.obfuscators.keys():
+        raise ValueError(f"No config section for {args.obfuscator}")
+    obfuscator: Obfuscators = config.obfuscators.pop(args.obfuscator)
+    db_obfuscator = init_obfuscator(config=config, name=args.obfuscator, obfuscator=obfuscator)
+    if args.sample:
+        db_obfuscator.sample_sensitive()
+        return
+    leaks = db_obfuscator.verify()
+    for table, count in sorted(leaks.items()):
+        _logger.info(f"{table}: {count}")
+    leaked = {t: c for t, c in leaks.items() if c > 0}
+    if leaked:
+        raise LeakDetectedError(f"Sensitive values found in {len(leaked)} tables: {', '.join(sorted(leaked))}")
+    _logger.info("No leaks found")
+
+
+@command(
+    [
+        argument(
+            "obfuscators",
+            help="Sections from config file which to watch, all if not set",
+            nargs="*"
+        ),
+        argument(
+            "--delay",
+            help="Seconds to wait after new backup appears before obfuscating",
+            type=int,
+            default=60
+        )
+    ]
+)
+def serve(args: argparse.Namespace) -> None:
+    """
+    Watch backup sources and obfuscate new backups as they appear
+    """
+    config = parse_config(args.config)
+    sections = args.obfuscators or list(config.obfuscators.keys())
+    for section in sections:
+        if section not in config.obfuscators.keys():
+            raise ValueError(f"No config section for {section}")
+    daemon = DonkyDaemon(config=config, sections=sections, delay=args.delay)
+    daemon.run()
+
+
+def init_queue(config: Donky, path: str = None) -> JobQueue:
+    """
+    Open shared job queue from cli option or config
+    """
+    path = path or config.queue
+    if path is None:
+        raise ValueError("Queue path not set, use --queue or queue in Donky section")
+    return JobQueue(path=path, lease=int(config.queue_lease))
+
+
+@command(
+    [
+        argument(
+            "obfuscators",
+            help="Sections from config file which to queue, all if not set",
+            nargs="*"
+        ),
+        argument(
+            "--queue",
+            help="Path to shared queue file"
+        ),
+        argument(
+            "--verify",
+            help="Verify obfuscation after job finishes",
+            action="store_true"
+        )
+    ]
+)
+def submit(args: argparse.Namespace) -> None:
+    """
+    Queue sections for workers on shared queue
+    """
+    config = parse_config(args.config)
+    _logger = logging.getLogger("Donky")
+    job_queue = init_queue(config=config, path=args.queue)
+    sections = args.obfuscators or list(config.obfuscators.keys())
+    for section in sections:
+        if section not in config.obfuscators.keys():
+            raise ValueError(f"No config section for {section}")
+        job_id = job_queue.submit(kind="obfuscate", section=section, payload={"verify": args.verify})
+        _logger.info(f"Queued {section}: job {job_id}")
+
+
+@command(
+    [
+        argument(
+            "obfuscators",
+            help="Sections from config file which worker takes, all if not set",
+            nargs="*"
+        ),
+        argument(
+            "--queue",
+            help="Path to shared queue file"
+        ),
+        argument(
+            "--exit-when-empty",
+            help="Exit when there are no jobs left",
+            action="store_true"
+        )
+    ]
+)
+def worker(args: argparse.Namespace) -> None:
+    """
+    Take jobs from shared queue and run them
+    """
+    config = parse_config(args.config)
+    sections = args.obfuscators or list(config.obfuscators.keys())
+    for section in sections:
+        if section not in config.obfuscators.keys():
+            raise ValueError(f"No config section for {section}")
+    job_queue = init_queue(config=config, path=args.queue)
+    Worker(config=config, queue=job_queue, sections=sections).run(exit_when_empty=args.exit_when_empty)
 
 
 def main() -> None:
@@ -0,0 +1,95 @@
+import logging
+import sqlalchemy
+
+CONCURRENCY_MODES = [
+    "fixed",
+    "adaptive"
+]
+DEFAULT_INTERVAL = 5
+THROUGHPUT_TOLERANCE = 0.05
+THREADS_RUNNING_FACTOR = 2
+PROGRESS_VARIABLES = [
+    "Innodb_rows_read",
+    "Innodb_rows_updated",
+    "Innodb_rows_inserted",
+    "Innodb_rows_deleted"
+]
+STATUS_VARIABLES = [
+    "Threads_running",
+    "Innodb_row_lock_waits"
+] + PROGRESS_VARIABLES
+
+
+def server_status(conn: sqlalchemy.engine.Connection) -> dict:
+    """
+    Read server load and row progress counters
+    """
+    names = ", ".join(f"'{v}'" for v in STATUS_VARIABLES)
+    result = conn.execute(sqlalchemy.text(f"SHOW GLOBAL STATUS WHERE Variable_name IN ({names})"))
+    return {row[0]: int(row[1]) for row in result}
+
+
+class AdaptiveController():
+    """
+    Hill climbing controller for number of in-flight statement batches,
+    moves limit towards row throughput peak between min and max workers,
+    backs off when server threads pile up or lock waits rise
+    """
+
+    def __init__(
+            self,
+            min_workers: int,
+            max_workers: int,
+            interval: int = DEFAULT_INTERVAL):
+        if min_workers < 1 or max_workers < min_workers:
+            raise ValueError(f"Invalid worker bounds: min {min_workers}, max {max_workers}")
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.interval = interval
+        self.limit = min_workers
+        self.direction = 1
+        self.last_status = None
+        self.last_throughput = None
+        self.last_lock_rate = None
+        self.last_threads = None
+        self._logger = logging.getLogger("Donky")
+
+    def _clamp(self, limit: int) -> int:
+        return max(self.min_workers, min(self.max_workers, limit))
+
+    def _rate(self, status: dict, names: list, elapsed: float) -> float:
+        if self.last_status is None or elapsed <= 0:
+            return None
+        return sum(status.get(n, 0) - self.last_status.get(n, 0) for n in names) / elapsed
+
+    def update(self, elapsed: float, status: dict) -> int:
+        """
+        Adjust limit from server counters read elapsed seconds after
+        previous ones, first call only records them. Returns new limit
+        """
+        throughput = self._rate(status=status, names=PROGRESS_VARIABLES, elapsed=elapsed)
+        lock_rate = self._rate(status=status, names=["Innodb_row_lock_waits"], elapsed=elapsed)
+        threads = status.get("Threads_running", 0)
+        self.last_status = status
+        if throughput is None:
+            return self.limit
+        lock_rising = self.last_lock_rate is not None and lock_rate > self.last_lock_rate
+        threads_rising = self.last_threads is not None and threads > self.last_threads
+        if threads > self.limit * THREADS_RUNNING_FACTOR + 1:
+            self.direction = -1
+        elif self.last_throughput is None:
+            self.direction = 1
+        elif throughput < self.last_throughput * (1 - THROUGHPUT_TOLERANCE):
+            self.direction = -self.direction or -1
+        elif throughput > self.last_throughput * (1 + THROUGHPUT_TOLERANCE):
+            self.direction = self.direction or 1
+        else:
+            self.direction = -1 if lock_rising or threads_rising else 0
+        self.limit = self._clamp(self.limit + self.direction)
+        self._logger.debug(
+            f"Throughput: {throughput:.0f} rows/s, lock waits: {lock_rate:.2f}/s, "
+            f"threads running: {threads}, workers: {self.limit}")
+        self.last_throughput = throughput
+        self.last_lock_rate = lock_rate
+        self.last_threads = threads
+        return self.limit
@@ -6,11 +6,19 @@ import os
 import logging
 from donky._logger import CustomLogger, init_logger
 from donky.helpers import drop_user_privileges
+from donky.transforms import parse_rules
+from donky.concurrency import CONCURRENCY_MODES
 
 DEFAULT_NUM_PROC = 4
+DEFAULT_PORT = 3306
 DEFAULT_LOG_LEVEL = "info"
 DEFAULT_LOG_FORMAT = "%(message)s"
 LOG_TRACE = 5
+STORAGE_TYPES = [
+    "auto",
+    "disk",
+    "tmpfs"
+]
 
 
 class CustomLoggerClass(logging.Logger):
@@ -57,15 +65,46 @@ class Obfuscators():
     obfuscator_source: str
     repository: str
     search_name: str
+    port: int = dataclasses.field(default=None)
     registry: str = dataclasses.field(default="docker.io")
     server_version: float = dataclasses.field(default=None)
     tool_version: float = dataclasses.field(default=None)
     image: str = dataclasses.field(default=None)
     backup_file: str = dataclasses.field(default=None)
+    incremental_files: list = dataclasses.field(default_factory=list)
     compressed: bool = dataclasses.field(default=False)
+    restored_size: int = dataclasses.field(default=None)
+    storage: str = dataclasses.field(default="auto")
+    volume_path: str = dataclasses.field(default=None)
+    memory_budget: str = dataclasses.field(default=None)
+    transforms: str = dataclasses.field(default=None)
+    transform_key: str = dataclasses.field(default=None, repr=False)
+    transform_seed: str = dataclasses.field(default="0")
+    verify_columns: str = dataclasses.field(default=None)
+    verify_sample: int = dataclasses.field(default=100000)
+    output_dir: str = dataclasses.field(default=None)
+    chunk_size: int = dataclasses.field(default=100000)
+    rules_file: str = dataclasses.field(default=None)
+    batch_size: int = dataclasses.field(default=1)
+    batch_max_cost: float = dataclasses.field(default=1.0)
 
     def __post_init__(self):
         [self.__setattr__(k, v.strip('\"').strip("\'")) for k, v in self.__dict__.items() if isinstance(v, str)]
+        if self.port is not None:
+            self.port = int(self.port)
+        if self.storage not in STORAGE_TYPES:
+            raise ValueError(f"Storage {self.storage} not one of: {', '.join(STORAGE_TYPES)}")
+        if self.transforms is not None:
+            if self.transform_key is None:
+                raise ValueError("transform_key is required when transforms are configured")
+            parse_rules(spec=self.transforms)
+
+    def dump(self) -> dict:
+        """
+        Fields for logging, secrets (repr=False fields) are redacted
+        """
+        hidden = [f.name for f in dataclasses.fields(self) if not f.repr]
+        return {k: "***" if k in hidden and v is not None else v for k, v in self.__dict__.items()}
 
 
 @dataclasses.dataclass()
@@ -80,10 +119,17 @@ class Donky():
     log_format: str = dataclasses.field(default=DEFAULT_LOG_FORMAT)
     num_process: int = dataclasses.field(default=4)
     tmp: str = dataclasses.field(default="/tmp")
+    concurrency: str = dataclasses.field(default="fixed")
+    min_process: int = dataclasses.field(default=1)
+    max_process: int = dataclasses.field(default=None)
+    queue: str = dataclasses.field(default=None)
+    queue_lease: int = dataclasses.field(default=300)
     obfuscators: dict = dataclasses.field(default_factory=dict, init=False, repr=False)
     _logger: CustomLogger = dataclasses.field(default=None, repr=False)
 
     def __post_init__(self):
+        if self.concurrency not in CONCURRENCY_MODES:
+            raise ValueError(f"Concurrency {self.concurrency} not one of: {', '.join(CONCURRENCY_MODES)}")
         self.uid = drop_user_privileges(user=self.user)
         self._logger = init_logger(log_level=self.log_level, log_format=self.log_format)
 
@@ -105,4 +151,23 @@ def parse_config(file: str) -> Donky:
     for section in config.sections():
         obf = Obfuscators(**config[section])
         donky.obfuscators[section] = obf
+    assign_ports(obfuscators=donky.obfuscators)
     return donky
+
+
+def assign_ports(obfuscators: dict, base: int = DEFAULT_PORT) -> None:
+    """
+    Give sections without port their own mysql host port,
+    so their containers can run side by side
+    """
+    ports = [o.port for o in obfuscators.values() if o.port is not None]
+    if len(ports) != len(set(ports)):
+        raise ValueError(f"Sections share mysql port: {', '.join(str(p) for p in sorted(ports))}")
+    port = base
+    for obfuscator in obfuscators.values():
+        if obfuscator.port is not None:
+            continue
+        while port in ports:
+            port += 1
+        obfuscator.port = port
+        ports.append(port)
@@ -17,6 +17,7 @@ class Container():
         self.image = image
         self.image_tag = tag
         self.registry = registry
+        self.storage = kwargs.get("volume", {}).get("storage")
         if engine.lower() == "podman":
             image = {
                 "image": image,
@@ -44,6 +45,9 @@ class Container():
     def name(self) -> str:
         return self.container.container.name
 
+    def image_updated(self) -> bool:
+        return self.container.image_updated(image=self.image, tag=self.image_tag)
+
     def reload(self) -> None:
         self.container.container.reload()
 
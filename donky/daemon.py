@@ -0,0 +1,167 @@
+import copy
+import ctypes
+import ctypes.util
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+from donky.config import Donky
+from donky.backups import resolve_backup
+from donky.helpers import create_mysql_container
+from donky.runner import run_obfuscator, update_obfuscator
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT = struct.Struct("iIII")
+BACKUP_INFO_FILE = "xtrabackup_info"
+
+
+class Inotify():
+    """
+    Minimal recursive inotify watcher over libc
+    """
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+
+    def add_watch(self, path: str) -> None:
+        wd = self._libc.inotify_add_watch(self.fd, path.encode(), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"Can't watch {path}")
+        self.watches[wd] = path
+
+    def add_tree(self, path: str) -> None:
+        for root, dirs, files in os.walk(path):
+            self.add_watch(root)
+
+    def read(self):
+        """
+        Block until events arrive, yields path and event mask
+        """
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0").decode()
+            offset += EVENT.size + length
+            if wd in self.watches.keys():
+                yield os.path.join(self.watches[wd], name), mask
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class DonkyDaemon():
+    """
+    Watch backup sources and obfuscate sections when new backup appears,
+    podman client, images and mysql containers are kept between runs
+    """
+
+    def __init__(self, config: Donky, sections: list, delay: int = 60):
+        self.config = config
+        self.sections = sections
+        self.delay = delay
+        self.queue = queue.Queue()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.containers = {}
+        self._logger = logging.getLogger("Donky")
+
+    def sections_for(self, path: str) -> list:
+        """
+        Find sections whose backup source contains path
+        """
+        sections = []
+        for section in self.sections:
+            source = os.path.abspath(self.config.obfuscators[section].backup_source)
+            if os.path.commonpath([source, os.path.abspath(path)]) == source:
+                sections.append(section)
+        return sections
+
+    def enqueue(self, path: str) -> None:
+        for section in self.sections_for(path=path):
+            with self.lock:
+                if section in self.pending:
+                    continue
+                self.pending.add(section)
+            self._logger.info(f"New backup for {section}: {path}")
+            self.queue.put(section)
+
+    def watch(self) -> None:
+        """
+        Watch backup sources, queue section when xtrabackup_info appears
+        """
+        inotify = Inotify()
+        for source in set(self.config.obfuscators[s].backup_source for s in self.sections):
+            self._logger.info(f"Watching {source}")
+            inotify.add_tree(source)
+        while True:
+            for path, mask in inotify.read():
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    inotify.add_tree(path)
+                    if os.path.exists(os.path.join(path, BACKUP_INFO_FILE)):
+                        self.enqueue(path=path)
+                elif os.path.basename(path) == BACKUP_INFO_FILE and mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    self.enqueue(path=path)
+
+    def warm_up(self, section: str) -> None:
+        """
+        Pull image and bootstrap mysql container for newest backup server version
+        """
+        obfuscator = copy.deepcopy(self.config.obfuscators[section])
+        backup = resolve_backup(
+                backup_type=obfuscator.backup_type,
+                backup_path=obfuscator.backup_source,
+                name_pattern=obfuscator.search_name,
+                threads=int(self.config.num_process),
+                cache_file=f"{self.config.tmp}/donky_backup_checks.json")
+        update_obfuscator(obfuscator=obfuscator, data=backup)
+        self._logger.info(f"Warming up mysql container for {section}")
+        self.containers[section] = create_mysql_container(
+                name=f"mysql_{section}",
+                engine=self.config.container_engine,
+                con_data=obfuscator.__dict__)
+
+    def process(self, section: str) -> None:
+        self._logger.debug(f"Waiting {self.delay}s for backup of {section} to settle")
+        time.sleep(self.delay)
+        with self.lock:
+            self.pending.discard(section)
+        obfuscator = copy.deepcopy(self.config.obfuscators[section])
+        self.containers[section] = run_obfuscator(
+            config=self.config,
+            name=section,
+            obfuscator=obfuscator,
+            mysql_container=self.containers.get(section))
+
+    def run(self) -> None:
+        """
+        Process queued sections one at a time
+        """
+        watcher = threading.Thread(target=self.watch, daemon=True)
+        watcher.start()
+        for section in self.sections:
+            try:
+                self.warm_up(section=section)
+            except Exception:
+                self._logger.exception(f"Warming up {section} failed")
+        self._logger.info("Donky daemon started")
+        while watcher.is_alive():
+            try:
+                section = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                self.process(section=section)
+            except Exception:
+                self._logger.exception(f"Obfuscating {section} failed")
+        raise RuntimeError("Backup watcher stopped")
@@ -18,7 +18,7 @@ class BackupEncryptedError(Exception):
 
 class IncrementalBackupError(Exception):
     """
-    Exception if backup is incremental
+    Exception for broken incremental backup chain
     """
 
 
@@ -32,3 +32,21 @@ class BackupNotFoundError(Exception):
     """
     Backup not found exception
     """
+
+
+class LeakDetectedError(Exception):
+    """
+    Sensitive values found after obfuscation
+    """
+
+
+class BackupCorruptedError(Exception):
+    """
+    Backup file failed integrity check
+    """
+
+
+class LeaseLostError(Exception):
+    """
+    Job lease expired or was taken over by other worker
+    """
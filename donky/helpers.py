@@ -6,6 +6,14 @@ from donky.containers import Container
 import logging
 import json
 
+TMPFS_HEADROOM = 1.5
+SIZE_UNITS = {
+    "k": 1024,
+    "m": 1024 ** 2,
+    "g": 1024 ** 3,
+    "t": 1024 ** 4
+}
+
 
 def podman_start_user_service() -> None:
     """
@@ -45,22 +53,64 @@ def drop_user_privileges(user: str) -> int:
     return pw.pw_uid
 
 
+def parse_size(size: str) -> int:
+    """
+    Parse size with optional K/M/G/T suffix to bytes
+    """
+    size = str(size).strip().lower()
+    if size[-1:] in SIZE_UNITS.keys():
+        return int(float(size[:-1]) * SIZE_UNITS[size[-1]])
+    return int(size)
+
+
+def resolve_storage(
+        storage: str,
+        restored_size: int = None,
+        memory_budget: str = None) -> str:
+    """
+    Choose datadir storage, auto selects tmpfs when restored
+    database fits into memory budget
+    """
+    _logger = logging.getLogger("Donky")
+    if storage != "auto":
+        return storage
+    if memory_budget is None or restored_size is None:
+        return "disk"
+    required = int(restored_size * TMPFS_HEADROOM)
+    if required <= parse_size(memory_budget):
+        _logger.info(f"Restored size {restored_size} fits memory budget {memory_budget}, using tmpfs")
+        return "tmpfs"
+    _logger.debug(f"Restored size {restored_size} exceeds memory budget {memory_budget}, using disk")
+    return "disk"
+
+
 def create_mysql_container(
         con_data: dict,
         name: str,
         engine: str) -> Container:
     _logger = logging.getLogger("Donky")
     config: dict = {}
+    storage = resolve_storage(
+        storage=con_data.get("storage", "auto"),
+        restored_size=con_data.get("restored_size"),
+        memory_budget=con_data.get("memory_budget"))
     volume = {
         "name": name,
         "bind": "/var/lib/mysql",
         "mode": "rw",
-        "force": True
+        "force": True,
+        "storage": storage
     }
+    if storage == "tmpfs":
+        if con_data.get("memory_budget") is None:
+            raise ValueError("memory_budget is required for tmpfs storage")
+        volume["size"] = parse_size(con_data.get("memory_budget"))
+    elif con_data.get("volume_path") is not None:
+        volume["path"] = os.path.join(con_data.get("volume_path"), name)
     cont_config = {
         "name": name,
         "ports": {
-            "3306/tcp": "3306"
+            "3306/tcp": str(con_data.get("port") or 3306)
         },
         "environment": {
             "MYSQL_ALLOW_EMPTY_PASSWORD": "true"
@@ -81,16 +131,40 @@ def create_mysql_container(
     return container
 
 
+def create_volume_holder(
+        name: str,
+        container: Container,
+        engine: str) -> Container:
+    """
+    Idle container sharing volumes of given container, tmpfs volume
+    is unmounted when last container using it stops, so holder keeps
+    it mounted while mysql is stopped for restore
+    """
+    _logger = logging.getLogger("Donky")
+    _logger.debug(f"Creating volume holder {name} for {container.name}")
+    return Container(
+        image=container.image,
+        tag=container.image_tag,
+        registry=container.registry,
+        engine=engine,
+        command=["sleep", "infinity"],
+        volumes_from=[container.name],
+        container={"name": name, "recreate": True})
+
+
 def restore_backup(
         name: str,
         backup_file: str,
         registry: str,
         version: float,
         volumes_from: str,
-        engine: str) -> Container:
+        engine: str,
+        incremental_files: list = None,
+        recreate: bool = False) -> Container:
     _logger = logging.getLogger("Donky")
-    backup_file_name = os.path.basename(backup_file)
-    backup_path = backup_file.rstrip(backup_file_name)
+    if incremental_files is None:
+        incremental_files = []
+    backup_path = os.path.commonpath([os.path.dirname(f) for f in [backup_file] + incremental_files])
     xtrabackup_container = {
         "name": name,
         "image": "perconalab/percona-xtrabackup",
@@ -99,19 +173,31 @@ def restore_backup(
     }
     x_container = {
         "name": name,
-        "recreate": False,
+        "recreate": recreate,
     }
     mount = {
         "source": backup_path,
         "target": "/backup",
     }
-    command = f"""
-        /usr/bin/rm -rf /var/lib/mysql/* &&
-        /usr/bin/cat /backup/{backup_file_name} | /usr/bin/xbstream -x --directory /var/lib/mysql &&
-        xtrabackup --decompress --parallel 4 --remove-original --target-dir=/var/lib/mysql &&
-        xtrabackup --prepare --target-dir=/var/lib/mysql &&
-        chown -R 999:999 /var/lib/mysql/*
-        """
+    apply_log_only = " --apply-log-only" if incremental_files else ""
+    commands = [
+        "/usr/bin/rm -rf /var/lib/mysql/*",
+        f"/usr/bin/cat /backup/{os.path.relpath(backup_file, backup_path)} | /usr/bin/xbstream -x --directory /var/lib/mysql",
+        "xtrabackup --decompress --parallel 4 --remove-original --target-dir=/var/lib/mysql",
+        f"xtrabackup --prepare{apply_log_only} --target-dir=/var/lib/mysql",
+    ]
+    for i, incremental_file in enumerate(incremental_files):
+        incremental_dir = f"/tmp/incremental_{i}"
+        commands.append(f"/usr/bin/mkdir -p {incremental_dir}")
+        commands.append(f"/usr/bin/cat /backup/{os.path.relpath(incremental_file, backup_path)} | /usr/bin/xbstream -x --directory {incremental_dir}")
+        commands.append(f"xtrabackup --decompress --parallel 4 --remove-original --target-dir={incremental_dir}")
+        commands.append(f"xtrabackup --prepare --apply-log-only --target-dir=/var/lib/mysql --incremental-dir={incremental_dir}")
+        commands.append(f"/usr/bin/rm -rf {incremental_dir}")
+    if incremental_files:
+        commands.append("xtrabackup --prepare --target-dir=/var/lib/mysql")
+    commands.append("chown -R 999:999 /var/lib/mysql/*")
+    command = " &&\n".join(commands)
+    _logger.debug(f"Restoring full backup with {len(incremental_files)} incrementals")
     xtrabackup_container["mount"] = mount
     xtrabackup_container["container"] = x_container
     xtrabackup_container["command"] = ["/bin/sh", "-c", command]
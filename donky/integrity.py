@@ -0,0 +1,182 @@
+import concurrent.futures
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from donky.exceptions import BackupCorruptedError
+
+XBSTREAM_MAGIC = b"XBSTCK01"
+CHUNK_PAYLOAD = ord("P")
+CHUNK_SPARSE = ord("S")
+CHUNK_EOF = ord("E")
+CHUNK_HEADER = struct.Struct("<8sBBI")
+PAYLOAD_HEADER = struct.Struct("<QQI")
+SPARSE_HEADER = struct.Struct("<I")
+SPARSE_ENTRY_SIZE = 8
+TASK_SIZE = 64 * 1024 * 1024
+READ_BUFFER = 16 * 1024 * 1024
+SIDECAR_HASHES = {
+    ".md5": "md5",
+    ".sha1": "sha1",
+    ".sha256": "sha256",
+    ".sha512": "sha512"
+}
+
+
+def parse_xbstream(data: mmap.mmap, file: str) -> list:
+    """
+    Walk xbstream chunk headers without reading payloads,
+    returns (sparse map offset, sparse map length, payload offset, payload length, checksum)
+    for every payload chunk
+    """
+    size = len(data)
+    offset = 0
+    chunks = []
+    open_files = set()
+    while offset < size:
+        if offset + CHUNK_HEADER.size > size:
+            raise BackupCorruptedError(f"{file}: truncated chunk header at {offset}")
+        magic, flags, chunk_type, path_len = CHUNK_HEADER.unpack_from(data, offset)
+        if magic != XBSTREAM_MAGIC:
+            raise BackupCorruptedError(f"{file}: bad chunk magic at {offset}")
+        offset += CHUNK_HEADER.size
+        path = data[offset:offset + path_len].decode(errors="replace")
+        offset += path_len
+        if chunk_type == CHUNK_EOF:
+            open_files.discard(path)
+            continue
+        if chunk_type not in (CHUNK_PAYLOAD, CHUNK_SPARSE):
+            raise BackupCorruptedError(f"{file}: unknown chunk type {chunk_type} at {offset}")
+        sparse_entries = 0
+        if chunk_type == CHUNK_SPARSE:
+            if offset + SPARSE_HEADER.size > size:
+                raise BackupCorruptedError(f"{file}: truncated sparse header at {offset}")
+            sparse_entries, = SPARSE_HEADER.unpack_from(data, offset)
+            offset += SPARSE_HEADER.size
+        if offset + PAYLOAD_HEADER.size > size:
+            raise BackupCorruptedError(f"{file}: truncated payload header at {offset}")
+        payload_len, payload_offset, checksum = PAYLOAD_HEADER.unpack_from(data, offset)
+        offset += PAYLOAD_HEADER.size
+        sparse_offset = offset
+        sparse_len = sparse_entries * SPARSE_ENTRY_SIZE
+        offset += sparse_len
+        if offset + payload_len > size:
+            raise BackupCorruptedError(f"{file}: truncated payload of {path} at {offset}")
+        chunks.append((sparse_offset, sparse_len, offset, payload_len, checksum))
+        open_files.add(path)
+        offset += payload_len
+    if open_files:
+        raise BackupCorruptedError(f"{file}: stream ended before end of {len(open_files)} files: {', '.join(sorted(open_files)[:5])}")
+    return chunks
+
+
+def split_tasks(chunks: list, task_size: int = TASK_SIZE) -> list:
+    """
+    Split chunks to tasks of roughly task_size bytes
+    """
+    tasks = []
+    task = []
+    task_bytes = 0
+    for chunk in chunks:
+        task.append(chunk)
+        task_bytes += chunk[3]
+        if task_bytes >= task_size:
+            tasks.append(task)
+            task = []
+            task_bytes = 0
+    if task:
+        tasks.append(task)
+    return tasks
+
+
+def check_chunks(data: mmap.mmap, chunks: list) -> int:
+    """
+    Verify payload checksums, returns offset of first bad chunk or None
+    """
+    with memoryview(data) as view:
+        for sparse_offset, sparse_len, offset, length, checksum in chunks:
+            crc = zlib.crc32(view[sparse_offset:sparse_offset + sparse_len])
+            if zlib.crc32(view[offset:offset + length], crc) != checksum:
+                return offset
+    return None
+
+
+def check_sidecar(file: str) -> bool:
+    """
+    Verify checksum file next to backup, False if there is none
+    """
+    for suffix, algorithm in SIDECAR_HASHES.items():
+        sidecar = f"{file}{suffix}"
+        if not os.path.isfile(sidecar):
+            continue
+        with open(sidecar, "r") as f:
+            fields = f.read().split()
+        if len(fields) == 0:
+            raise BackupCorruptedError(f"{file}: checksum file {sidecar} is empty")
+        expected = fields[0].lower()
+        digest = hashlib.new(algorithm)
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(READ_BUFFER), b""):
+                digest.update(block)
+        if digest.hexdigest() != expected:
+            raise BackupCorruptedError(f"{file}: {algorithm} doesn't match {sidecar}")
+        return True
+    return False
+
+
+def check_backup_file(file: str, format: str, threads: int = 4) -> None:
+    """
+    Validate xbstream structure and chunk checksums across threads,
+    sidecar checksum file is verified alongside
+    """
+    _logger = logging.getLogger("Donky")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(threads, 1)) as executor:
+        sidecar = executor.submit(check_sidecar, file)
+        if format == "xbstream" and os.path.getsize(file) > 0:
+            with open(file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                tasks = split_tasks(parse_xbstream(data=data, file=file))
+                _logger.debug(f"Checking {file} in {len(tasks)} tasks")
+                futures = [executor.submit(check_chunks, data, task) for task in tasks]
+                bad = [f.result() for f in futures]
+            bad = [b for b in bad if b is not None]
+            if bad:
+                raise BackupCorruptedError(f"{file}: checksum mismatch in chunk at {min(bad)}")
+        elif format == "xbstream":
+            raise BackupCorruptedError(f"{file}: empty backup file")
+        if sidecar.result():
+            _logger.debug(f"{file}: sidecar checksum ok")
+
+
+def _file_key(file: str) -> dict:
+    stat = os.stat(file)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def check_backup_files(
+        files: list,
+        format: str,
+        threads: int = 4,
+        cache_file: str = None) -> None:
+    """
+    Check backup files, results cached per file by size and mtime
+    """
+    _logger = logging.getLogger("Donky")
+    cache = {}
+    if cache_file is not None and os.path.isfile(cache_file):
+        with open(cache_file, "r") as f:
+            cache = json.load(f)
+    for file in files:
+        file = os.path.abspath(file)
+        key = _file_key(file)
+        if cache.get(file) == key:
+            _logger.debug(f"{file} already checked")
+            continue
+        _logger.info(f"Checking backup file integrity: {file}")
+        check_backup_file(file=file, format=format, threads=threads)
+        cache[file] = key
+    if cache_file is not None:
+        with open(cache_file, "w") as f:
+            json.dump(cache, f, indent=2)
@@ -0,0 +1,261 @@
+import contextlib
+import copy
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import signal
+import time
+from donky.config import Donky
+from donky.exceptions import LeakDetectedError, LeaseLostError
+from donky.runner import init_obfuscator, run_obfuscator
+
+DEFAULT_LEASE = 300
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_POLL_INTERVAL = 30
+JOB_KINDS = [
+    "obfuscate"
+]
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        section TEXT NOT NULL,
+        payload TEXT NOT NULL DEFAULT '{}',
+        state TEXT NOT NULL DEFAULT 'pending',
+        worker TEXT,
+        lease_until REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        created REAL NOT NULL,
+        updated REAL NOT NULL
+    )
+    """
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue():
+    """
+    Job queue in sqlite file on shared filesystem,
+    running jobs hold lease which workers extend with heartbeats,
+    jobs with expired lease are handed to other workers
+    """
+
+    def __init__(
+            self,
+            path: str,
+            lease: int = DEFAULT_LEASE,
+            max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._logger = logging.getLogger("Donky")
+        with self._transaction() as conn:
+            conn.execute(SCHEMA)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Connection with exclusive write transaction, committed on exit
+        """
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def submit(self, kind: str, section: str, payload: dict = None) -> int:
+        """
+        Add job, returns id of already queued job if same one is waiting or running
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        payload = json.dumps(payload or {}, sort_keys=True)
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND section = ? AND payload = ? AND state IN ('pending', 'running')",
+                (kind, section, payload)).fetchone()
+            if row is not None:
+                self._logger.info(f"Job {kind} {section} already queued: {row['id']}")
+                return row["id"]
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, section, payload, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (kind, section, payload, now, now))
+            return cursor.lastrowid
+
+    def claim(self, worker: str, sections: list) -> dict:
+        """
+        Take oldest pending job or running job with expired lease,
+        None if there is nothing to do
+        """
+        now = time.time()
+        marks = ", ".join("?" for s in sections)
+        with self._transaction() as conn:
+            while True:
+                row = conn.execute(
+                    f"""
+                    SELECT * FROM jobs
+                    WHERE section IN ({marks})
+                      AND (state = 'pending' OR (state = 'running' AND lease_until < ?))
+                    ORDER BY id LIMIT 1
+                    """,
+                    (*sections, now)).fetchone()
+                if row is None:
+                    return None
+                if row["attempts"] < self.max_attempts:
+                    break
+                conn.execute(
+                    "UPDATE jobs SET state = 'failed', error = ?, updated = ? WHERE id = ?",
+                    (f"Lease expired after {row['attempts']} attempts", now, row["id"]))
+            if row["state"] == "running":
+                self._logger.warning(f"Lease of job {row['id']} held by {row['worker']} expired, taking over")
+            conn.execute(
+                "UPDATE jobs SET state = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker, now + self.lease, now, row["id"]))
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        """
+        Extend job lease, False if job is not held by worker anymore
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated = ? WHERE id = ? AND worker = ? AND state = 'running'",
+                (now + self.lease, now, job_id, worker))
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker: str) -> None:
+        """
+        Mark job done, refused when worker doesn't hold valid lease anymore
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs SET state = 'done', lease_until = NULL, updated = ?
+                WHERE id = ? AND worker = ? AND state = 'running' AND lease_until >= ?
+                """,
+                (now, job_id, worker, now))
+            if cursor.rowcount != 1:
+                raise LeaseLostError(f"Job {job_id} is not held by {worker} anymore")
+
+    def fail(self, job_id: int, worker: str, error: str) -> bool:
+        """
+        Return job to queue or mark it failed when attempts are exhausted,
+        False if job is not held by worker anymore
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs
+                SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    error = ?, lease_until = NULL, updated = ?
+                WHERE id = ? AND worker = ? AND state = 'running'
+                """,
+                (self.max_attempts, error, time.time(), job_id, worker))
+            return cursor.rowcount == 1
+
+    def jobs(self) -> list:
+        with self._transaction() as conn:
+            return [dict(r) for r in conn.execute("SELECT * FROM jobs ORDER BY id")]
+
+
+class Worker():
+    """
+    Take jobs from shared queue and run them one at a time,
+    each job uses this host's num_process budget
+    """
+
+    def __init__(
+            self,
+            config: Donky,
+            queue: JobQueue,
+            sections: list,
+            poll_interval: int = DEFAULT_POLL_INTERVAL):
+        self.config = config
+        self.queue = queue
+        self.sections = sections
+        self.poll_interval = poll_interval
+        self.worker = worker_id()
+        self._logger = logging.getLogger("Donky")
+
+    def _heartbeat(self, job_id: int, stop: threading.Event, lost: threading.Event) -> None:
+        """
+        Extend lease until stopped, interrupts running job when lease is lost
+        """
+        while not stop.wait(self.queue.lease / 3):
+            if not self.queue.heartbeat(job_id=job_id, worker=self.worker):
+                self._logger.error(f"Lost lease of job {job_id}, aborting it")
+                lost.set()
+                signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+                return
+
+    def run_job(self, job: dict) -> None:
+        """
+        Obfuscate section, mysql container is stopped when job ends,
+        so it doesn't hold its port and memory while other sections run
+        """
+        section = job["section"]
+        obfuscator = copy.deepcopy(self.config.obfuscators[section])
+        mysql_container = run_obfuscator(config=self.config, name=section, obfuscator=obfuscator)
+        try:
+            if job["payload"].get("verify"):
+                db_obfuscator = init_obfuscator(config=self.config, name=section, obfuscator=obfuscator)
+                leaked = {t: c for t, c in db_obfuscator.verify().items() if c > 0}
+                if leaked:
+                    raise LeakDetectedError(f"Sensitive values found in {len(leaked)} tables: {', '.join(sorted(leaked))}")
+        finally:
+            mysql_container.stop()
+
+    def run(self, exit_when_empty: bool = False) -> None:
+        self._logger.info(f"Worker {self.worker} started")
+        while True:
+            job = self.queue.claim(worker=self.worker, sections=self.sections)
+            if job is None:
+                if exit_when_empty:
+                    return
+                time.sleep(self.poll_interval)
+                continue
+            self._logger.info(f"Running job {job['id']}: {job['kind']} {job['section']}")
+            stop = threading.Event()
+            lost = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat, args=(job["id"], stop, lost), daemon=True)
+            heartbeat.start()
+            try:
+                try:
+                    self.run_job(job=job)
+                finally:
+                    stop.set()
+                    heartbeat.join()
+            except KeyboardInterrupt:
+                if not lost.is_set():
+                    raise
+                self._logger.error(f"Job {job['id']} aborted, lease lost")
+            except Exception as e:
+                self._logger.exception(f"Job {job['id']} failed")
+                if not self.queue.fail(job_id=job["id"], worker=self.worker, error=str(e)):
+                    self._logger.error(f"Job {job['id']} is held by other worker, failure not recorded")
+            else:
+                try:
+                    self.queue.complete(job_id=job["id"], worker=self.worker)
+                except LeaseLostError:
+                    self._logger.exception(f"Job {job['id']} finished after lease was lost")
+                else:
+                    self._logger.info(f"Job {job['id']} done")
@@ -1,21 +1,102 @@
 import multiprocessing
 import socket
 import sqlalchemy
+import pymysql
+from pymysql.constants import CLIENT
 import time
 import logging
+import collections
+from donky.concurrency import AdaptiveController, server_status
+from donky.planner import Plan, build_plan, format_plan, merge_small_groups
+from donky.verify import (
+    DEFAULT_SAMPLE_SIZE,
+    BloomFilter,
+    build_filter,
+    scan_table,
+    text_columns
+)
+from donky.chunks import (
+    DEFAULT_CHUNK_SIZE,
+    chunk_checksums,
+    chunk_condition,
+    chunk_file,
+    chunks_condition,
+    copy_chunk,
+    export_chunk,
+    latest_run,
+    new_run_dir,
+    pk_chunks,
+    primary_key,
+    read_manifest,
+    rules_hash,
+    unchanged_chunks,
+    user_tables,
+    write_manifest
+)
+from donky.transforms import parse_rules
+from donky.rules import check_overlap, check_rules, compile_rules, derive_salt, is_rule_file, load_rules
+
+DEFAULT_SQL_FILE = "etc/donky/test.sql"
+DEFAULT_PORT = 3306
+DEFAULT_BATCH_SIZE = 1
+DEFAULT_BATCH_MAX_COST = 1.0
 
 
 class Obfuscator():
 
-    db_engine = sqlalchemy.create_engine(
-            url="mysql+pymysql://localhost/mysql",
-            pool_size=10)
+    _engines = {}
     _logger = logging.getLogger("Donky")
 
-    def __init__(self, proc: int = 4, port: int = 3306, socket_timeout: int = 10):
+    def __init__(
+            self,
+            proc: int = 4,
+            port: int = DEFAULT_PORT,
+            socket_timeout: int = 10,
+            sql_file: str = DEFAULT_SQL_FILE,
+            bloom_file: str = None,
+            verify_columns: list = None,
+            verify_sample: int = DEFAULT_SAMPLE_SIZE,
+            output_dir: str = None,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            transforms: str = None,
+            transform_key: str = None,
+            transform_seed: str = "0",
+            concurrency: str = "fixed",
+            min_proc: int = 1,
+            max_proc: int = None,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            batch_max_cost: float = DEFAULT_BATCH_MAX_COST):
+        self.port = port
         self.__wait_for_port(port=port, timeout=socket_timeout)
         self.num_proc = self._check_cpu_count(proc=proc)
-        self.execute_query("SET GLOBAL innodb_flush_log_at_trx_commit=2,sync_binlog=0")  # Some speed optimization for mysql
+        self.concurrency = concurrency
+        self.min_proc = min_proc
+        self.max_proc = max_proc or proc
+        self.batch_size = batch_size
+        self.batch_max_cost = batch_max_cost
+        self.sql_file = sql_file
+        self.bloom_file = bloom_file
+        self.verify_columns = verify_columns or []
+        self.verify_sample = verify_sample
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.transforms = transforms
+        self.rules = parse_rules(spec=transforms) if transforms else []
+        self.transform_key = transform_key
+        self.transform_seed = transform_seed
+
+    @property
+    def db_engine(self) -> sqlalchemy.engine.Engine:
+        """
+        Sqlalchemy engine per mysql port, shared by instances in process,
+        kept out of instance so it isn't pickled to pool workers
+        """
+        if self.port not in self._engines.keys():
+            self._engines[self.port] = sqlalchemy.create_engine(
+                url=f"mysql+pymysql://localhost:{self.port}/mysql",
+                pool_size=10,
+                connect_args={"client_flag": CLIENT.MULTI_STATEMENTS})
+        return self._engines[self.port]
 
     def __del__(self) -> None:
         """
@@ -89,6 +170,24 @@ class Obfuscator():
         self._logger.debug(f"SQL query count: {len(queries)}")
         return queries
 
+    def load_queries(self, exclude: dict = None) -> list:
+        """
+        Load statements from sql file or compile them from yaml rule file,
+        yaml rules skip rows matching exclude condition of table and are
+        salted with salt derived from transform key
+        """
+        if not is_rule_file(self.sql_file):
+            if exclude:
+                self._logger.info("SQL file rules can't be limited to changed chunks, running them on all rows")
+            return self.load_sql_file(sql_file=self.sql_file)
+        rules = load_rules(path=self.sql_file)
+        check_overlap(rules=rules, transforms=self.rules)
+        with self.db_engine.connect() as conn:
+            check_rules(conn=conn, rules=rules)
+        queries = compile_rules(rules=rules, exclude=exclude, salt=derive_salt(key=self.transform_key))
+        self._logger.debug(f"Compiled {len(queries)} statements from {self.sql_file}")
+        return queries
+
     def execute_query(self, query: str) -> None:
         """
         Execute sql query
@@ -96,13 +195,240 @@ class Obfuscator():
         with self.db_engine.connect() as conn:
             self._logger.debug(f"Executing: {query}")
             conn.execute(sqlalchemy.text(query))
+            conn.commit()
+
+    def _execute_batch(self, connection, queries: list) -> None:
+        """
+        Execute queries in one transaction and one round-trip
+        """
+        cursor = connection.cursor()
+        try:
+            self._logger.debug(f"Executing batch of {len(queries)}: {queries[0]}")
+            cursor.execute(";\n".join(queries))
+            while cursor.nextset():
+                pass
+            connection.commit()
+        except pymysql.err.Error:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def execute_batches(self, batches: list) -> None:
+        """
+        Execute batches one after another on single connection,
+        failed batch is retried statement by statement
+        """
+        connection = self.db_engine.raw_connection()
+        try:
+            for batch in batches:
+                try:
+                    self._execute_batch(connection=connection, queries=batch)
+                except pymysql.err.Error as e:
+                    if len(batch) == 1:
+                        raise
+                    self._logger.warning(f"Batch of {len(batch)} statements failed: {e}, retrying one by one")
+                    for query in batch:
+                        self._execute_batch(connection=connection, queries=[query])
+        finally:
+            connection.close()
+
+    def execute_adaptive(self, groups: list) -> None:
+        """
+        Execute statement groups batch by batch keeping number of in-flight
+        batches at limit found by adaptive controller, batches of one group
+        run one after another
+        """
+        controller = AdaptiveController(min_workers=self.min_proc, max_workers=self.max_proc)
+        pending = collections.deque(
+            collections.deque(g.batches(batch_size=self.batch_size, max_cost=self.batch_max_cost)) for g in groups)
+        running = []
+        with self.db_engine.connect() as conn:
+            controller.update(elapsed=0, status=server_status(conn=conn))
+        last_update = time.monotonic()
+        with multiprocessing.Pool(processes=self.max_proc, initializer=self.__initializer) as proc_pool:
+            while pending or running:
+                while pending and len(running) < controller.limit:
+                    batches = pending.popleft()
+                    running.append((proc_pool.apply_async(self.execute_batches, ([batches.popleft()],)), batches))
+                time.sleep(0.1)
+                done = [r for r in running if r[0].ready()]
+                for result, batches in done:
+                    result.get()
+                    if batches:
+                        pending.appendleft(batches)
+                running = [r for r in running if r not in done]
+                elapsed = time.monotonic() - last_update
+                if elapsed >= controller.interval:
+                    with self.db_engine.connect() as conn:
+                        status = server_status(conn=conn)
+                    controller.update(elapsed=elapsed, status=status)
+                    last_update = time.monotonic()
+
+    def plan(self, exclude: dict = None) -> Plan:
+        """
+        Estimate statements cost and order them longest first
+        """
+        queries = self.load_queries(exclude=exclude)
+        with self.db_engine.connect() as conn:
+            plan = build_plan(conn=conn, queries=queries, workers=self.num_proc)
+        for line in format_plan(plan):
+            self._logger.debug(line)
+        return plan
+
+    def sample_sensitive(self) -> None:
+        """
+        Sample original sensitive values to bloom filter file
+        """
+        if self.bloom_file is None or len(self.verify_columns) == 0:
+            self._logger.warning("No sensitive columns configured, skipping sampling")
+            return
+        self._logger.info(f"Sampling {len(self.verify_columns)} sensitive columns")
+        with self.db_engine.connect() as conn:
+            bloom = build_filter(conn=conn, columns=self.verify_columns, sample_size=self.verify_sample)
+        bloom.save(path=self.bloom_file)
+
+    def _scan_table(self, job: tuple) -> tuple:
+        """
+        Count leaked values in primary key range of table
+        """
+        table, columns, condition = job
+        bloom = BloomFilter.load(path=self.bloom_file)
+        with self.db_engine.connect() as conn:
+            leaks = scan_table(conn=conn, table=table, columns=columns, bloom=bloom, condition=condition)
+        self._logger.debug(f"Scanned {table} where {condition}, leaks: {leaks}")
+        return table, leaks
+
+    def reused_chunks(self) -> dict:
+        """
+        Chunks of last export reused from earlier run, rules skipped them,
+        so their rows are still original in restored copy
+        """
+        if self.output_dir is None:
+            return {}
+        manifest = read_manifest(run_dir=latest_run(self.output_dir))
+        if manifest is None or manifest.get("chunk_size") != self.chunk_size:
+            return {}
+        return manifest.get("reused", {})
+
+    def verify(self) -> dict:
+        """
+        Scan all text columns for sampled sensitive values in primary key
+        ranges spread across workers, returns leak count per table
+        """
+        self._logger.info("Verifying obfuscation")
+        reused = self.reused_chunks()
+        jobs = []
+        with self.db_engine.connect() as conn:
+            tables = text_columns(conn=conn)
+            for table, columns in tables.items():
+                pk = primary_key(conn=conn, table=table)
+                for chunk in pk_chunks(conn=conn, table=table, pk=pk, chunk_size=self.chunk_size):
+                    if chunk in reused.get(table, []):
+                        continue
+                    condition = chunk_condition(pk=pk, chunk=chunk, chunk_size=self.chunk_size)
+                    jobs.append((table, columns, condition))
+        self._logger.debug(f"Scanning {len(tables)} tables in {len(jobs)} ranges")
+        leaks = dict.fromkeys(tables, 0)
+        with multiprocessing.Pool(processes=self.num_proc, initializer=self.__initializer) as proc_pool:
+            for table, count in proc_pool.imap_unordered(self._scan_table, jobs):
+                leaks[table] += count
+        return leaks
+
+    def _checksum_table(self, table: str) -> tuple:
+        with self.db_engine.connect() as conn:
+            return table, chunk_checksums(conn=conn, table=table, chunk_size=self.chunk_size)
+
+    def detect_changes(self) -> tuple:
+        """
+        Checksum source tables in primary key chunks and compare with
+        previous run manifest, returns manifest and unchanged chunks
+        """
+        self._logger.info("Checksumming source tables")
+        with self.db_engine.connect() as conn:
+            tables = user_tables(conn=conn)
+        with multiprocessing.Pool(processes=self.num_proc, initializer=self.__initializer) as proc_pool:
+            checksums = dict(proc_pool.imap_unordered(self._checksum_table, tables))
+        manifest = {
+            "rules_hash": rules_hash(
+                files=[self.sql_file] + [r.args[0] for r in self.rules if r.transform == "substitute" and r.args],
+                spec=self.transforms,
+                key=self.transform_key,
+                seed=self.transform_seed),
+            "chunk_size": self.chunk_size,
+            "tables": checksums
+        }
+        unchanged = unchanged_chunks(manifest=manifest, previous=read_manifest(run_dir=latest_run(self.output_dir)))
+        total = sum(len(t["chunks"]) for t in checksums.values())
+        reused = sum(len(c) for c in unchanged.values())
+        self._logger.info(f"Unchanged chunks: {reused}/{total}")
+        return manifest, unchanged
+
+    def unchanged_conditions(self, manifest: dict, unchanged: dict) -> dict:
+        """
+        SQL condition selecting unchanged rows per table, source rows are
+        kept, so restored copy stays complete for rules and verification
+        """
+        conditions = {}
+        for table, chunks in unchanged.items():
+            pk = manifest["tables"][table]["primary_key"]
+            conditions[table] = chunks_condition(pk=pk, chunks=chunks, chunk_size=self.chunk_size)
+        return conditions
+
+    def _export_chunk(self, job: tuple) -> int:
+        run_dir, table, pk, chunk = job
+        with self.db_engine.connect() as conn:
+            return export_chunk(
+                conn=conn,
+                table=table,
+                condition=chunk_condition(pk=pk, chunk=chunk, chunk_size=self.chunk_size),
+                path=chunk_file(run_dir=run_dir, table=table, chunk=chunk),
+                rules=self.rules,
+                key=self.transform_key,
+                seed=self.transform_seed)
+
+    def export(self, manifest: dict, unchanged: dict) -> str:
+        """
+        Export changed chunks and reuse unchanged ones from previous run
+        """
+        previous_dir = latest_run(self.output_dir)
+        run_dir = new_run_dir(self.output_dir)
+        self._logger.info(f"Exporting to {run_dir}")
+        jobs = []
+        for table, data in manifest["tables"].items():
+            for chunk in data["chunks"].keys():
+                if chunk in unchanged.get(table, []):
+                    copy_chunk(previous_dir=previous_dir, run_dir=run_dir, table=table, chunk=chunk)
+                    continue
+                jobs.append((run_dir, table, data["primary_key"], chunk))
+        with multiprocessing.Pool(processes=self.num_proc, initializer=self.__initializer) as proc_pool:
+            rows = sum(proc_pool.imap_unordered(self._export_chunk, jobs))
+        self._logger.info(f"Exported {rows} rows in {len(jobs)} chunks")
+        write_manifest(run_dir=run_dir, manifest=dict(manifest, reused=unchanged))
+        return run_dir
 
     def obfuscate(self) -> None:
         """
         Execute obfuscator
         """
         self._logger.info("DB obfustator is starting")
-        obf_queries = self.load_sql_file(sql_file="etc/donky/test.sql")
-        with multiprocessing.Pool(processes=self.num_proc, initializer=self.__initializer) as proc_pool:
-            proc_pool.map(self.execute_query, obf_queries)
+        if self.bloom_file is not None:
+            self.sample_sensitive()
+        exclude = {}
+        if self.output_dir is not None:
+            manifest, unchanged = self.detect_changes()
+            exclude = self.unchanged_conditions(manifest=manifest, unchanged=unchanged)
+        self.execute_query("SET GLOBAL innodb_flush_log_at_trx_commit=2,sync_binlog=0")  # Some speed optimization for mysql
+        plan = self.plan(exclude=exclude)
+        self._logger.info(f"Predicted wall time: {plan.wall_time:.2f}s")
+        for phase in plan.phases:
+            groups = merge_small_groups(groups=phase, batch_size=self.batch_size, max_cost=self.batch_max_cost)
+            if self.concurrency == "adaptive":
+                self.execute_adaptive(groups=groups)
+            else:
+                with multiprocessing.Pool(processes=self.num_proc, initializer=self.__initializer) as proc_pool:
+                    batches = [g.batches(batch_size=self.batch_size, max_cost=self.batch_max_cost) for g in groups]
+                    list(proc_pool.imap_unordered(self.execute_batches, batches))
+        if self.output_dir is not None:
+            self.export(manifest=manifest, unchanged=unchanged)
         self._logger.info("DB obfuscator finished")
@@ -0,0 +1,365 @@
+import dataclasses
+import heapq
+import logging
+import re
+import sqlalchemy
+
+DEFAULT_ROWS_PER_SEC = 100000
+DEFAULT_BYTES_PER_SEC = 50 * 1024 * 1024
+SYSTEM_SCHEMAS = [
+    "information_schema",
+    "mysql",
+    "performance_schema",
+    "sys"
+]
+LITERAL_PATTERN = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+COMMENT_PATTERN = re.compile(r"/\*.*?\*/|--[^\n]*|#[^\n]*", re.DOTALL)
+TOKEN_PATTERN = re.compile(r"(?:`[^`]*`|\w+)(?:\.(?:`[^`]*`|\w+))*|\S")
+SUPPORTED_STATEMENTS = [
+    "UPDATE",
+    "DELETE",
+    "INSERT",
+    "REPLACE",
+    "TRUNCATE",
+    "ALTER",
+    "CREATE",
+    "DROP",
+    "SELECT",
+    "OPTIMIZE",
+    "ANALYZE"
+]
+DML_STATEMENTS = [
+    "UPDATE",
+    "DELETE",
+    "INSERT",
+    "REPLACE"
+]
+TABLE_KEYWORDS = [
+    "UPDATE",
+    "FROM",
+    "JOIN",
+    "INTO",
+    "TABLE",
+    "USING",
+    "DELETE",
+    "TRUNCATE"
+]
+MODIFIERS = [
+    "LOW_PRIORITY",
+    "HIGH_PRIORITY",
+    "DELAYED",
+    "QUICK",
+    "IGNORE",
+    "ONLINE",
+    "TEMPORARY",
+    "IF",
+    "NOT",
+    "EXISTS",
+    "TABLE",
+    "INTO"
+]
+RESERVED = set(TABLE_KEYWORDS + MODIFIERS + [
+    "SET", "WHERE", "INNER", "LEFT", "RIGHT", "OUTER", "CROSS", "NATURAL",
+    "STRAIGHT_JOIN", "ON", "AS", "ORDER", "GROUP", "HAVING", "LIMIT", "VALUES",
+    "VALUE", "SELECT", "PARTITION", "USE", "FORCE", "KEY", "INDEX", "UNION",
+    "WINDOW", "FOR", "LOCK", "ADD", "MODIFY", "CHANGE", "RENAME", "ENGINE",
+    "LIKE", "DUPLICATE", "DUAL"
+])
+
+
+@dataclasses.dataclass
+class PlannedStatement():
+    """
+    Dataclass for single statement cost estimation
+    """
+    query: str
+    position: int
+    tables: list = dataclasses.field(default_factory=list)
+    rows: int = dataclasses.field(default=0)
+    bytes: int = dataclasses.field(default=0)
+    cost: float = dataclasses.field(default=0.0)
+    barrier: bool = dataclasses.field(default=False)
+
+    @property
+    def dml(self) -> bool:
+        """
+        Row changing statement, which is rolled back with its transaction
+        """
+        tokens = _tokens(self.query)
+        return not self.barrier and len(tokens) > 0 and tokens[0].upper() in DML_STATEMENTS
+
+
+@dataclasses.dataclass
+class StatementGroup():
+    """
+    Dataclass for statements which touch same tables and must run in file order
+    """
+    statements: list = dataclasses.field(default_factory=list)
+
+    @property
+    def cost(self) -> float:
+        return sum(s.cost for s in self.statements)
+
+    @property
+    def queries(self) -> list:
+        return [s.query for s in self.statements]
+
+    def batches(self, batch_size: int, max_cost: float) -> list:
+        """
+        Split statements to transaction batches of consecutive small DML
+        statements, statements costlier than max_cost and statements which
+        commit implicitly (DDL, TRUNCATE) or can't be parsed run alone
+        """
+        batches = []
+        batch = []
+        for statement in self.statements:
+            if batch_size <= 1 or statement.cost > max_cost or not statement.dml:
+                if batch:
+                    batches.append(batch)
+                    batch = []
+                batches.append([statement.query])
+                continue
+            batch.append(statement.query)
+            if len(batch) >= batch_size:
+                batches.append(batch)
+                batch = []
+        if batch:
+            batches.append(batch)
+        return batches
+
+
+@dataclasses.dataclass
+class Plan():
+    """
+    Dataclass for statements execution plan,
+    phases run one after another, groups inside phase in parallel
+    """
+    phases: list
+    workers: int
+    wall_time: float
+    serial_time: float
+
+    @property
+    def groups(self) -> list:
+        return [g for phase in self.phases for g in phase]
+
+
+def table_stats(conn: sqlalchemy.engine.Connection) -> dict:
+    """
+    Read row counts and data sizes of user tables from information_schema
+    """
+    query = """
+        SELECT table_schema, table_name, table_rows, data_length
+        FROM information_schema.tables
+        WHERE table_type = 'BASE TABLE'
+        """
+    stats = {}
+    for row in conn.execute(sqlalchemy.text(query)).mappings():
+        row = {k.lower(): v for k, v in row.items()}
+        if row["table_schema"] in SYSTEM_SCHEMAS:
+            continue
+        data = {
+            "rows": int(row["table_rows"] or 0),
+            "bytes": int(row["data_length"] or 0)
+        }
+        stats[f"{row['table_schema']}.{row['table_name']}"] = data
+        stats.setdefault(row["table_name"], data)
+    return stats
+
+
+def _tokens(query: str) -> list:
+    query = LITERAL_PATTERN.sub("''", query)
+    query = COMMENT_PATTERN.sub(" ", query)
+    return TOKEN_PATTERN.findall(query)
+
+
+def _is_identifier(token: str) -> bool:
+    return (token[0] == "`" or token[0].isalnum() or token[0] == "_") and token.upper() not in RESERVED
+
+
+def _table_list(tokens: list, i: int, tables: list) -> None:
+    """
+    Read comma separated table references starting at i, aliases skipped
+    """
+    while i < len(tokens):
+        while i < len(tokens) and tokens[i].upper() in MODIFIERS:
+            i += 1
+        if i >= len(tokens) or not _is_identifier(tokens[i]):
+            return
+        table = tokens[i].replace("`", "")
+        if table not in tables:
+            tables.append(table)
+        i += 1
+        if i < len(tokens) and tokens[i].upper() == "AS":
+            i += 1
+        if i < len(tokens) and _is_identifier(tokens[i]):
+            i += 1
+        if i >= len(tokens) or tokens[i] != ",":
+            return
+        i += 1
+
+
+def statement_tables(query: str) -> list:
+    """
+    Find table names referenced by statement,
+    None if statement can't be parsed with confidence
+    """
+    tokens = _tokens(query)
+    if len(tokens) == 0 or tokens[0].upper() not in SUPPORTED_STATEMENTS:
+        return None
+    tables = []
+    for i, token in enumerate(tokens):
+        if token.upper() in TABLE_KEYWORDS:
+            _table_list(tokens=tokens, i=i + 1, tables=tables)
+    if len(tables) == 0:
+        return None
+    return tables
+
+
+def explain_rows(conn: sqlalchemy.engine.Connection, query: str) -> int:
+    """
+    Get number of rows mysql expects to examine for statement,
+    None if statement can't be explained
+    """
+    try:
+        result = conn.execute(sqlalchemy.text(f"EXPLAIN {query}")).mappings()
+        return sum(int(r.get("rows") or 0) for r in result)
+    except sqlalchemy.exc.DBAPIError:
+        conn.rollback()
+        return None
+
+
+def estimate_statement(
+        conn: sqlalchemy.engine.Connection,
+        query: str,
+        position: int,
+        stats: dict,
+        rows_per_sec: int = DEFAULT_ROWS_PER_SEC,
+        bytes_per_sec: int = DEFAULT_BYTES_PER_SEC) -> PlannedStatement:
+    """
+    Estimate statement runtime in seconds from explain output and table sizes
+    """
+    _logger = logging.getLogger("Donky")
+    tables = statement_tables(query)
+    statement = PlannedStatement(query=query, position=position, tables=tables or [], barrier=tables is None)
+    if statement.barrier:
+        _logger.debug(f"Can't find tables of statement, running it alone: {query}")
+    table_rows = sum(stats.get(t, {}).get("rows", 0) for t in statement.tables)
+    table_bytes = sum(stats.get(t, {}).get("bytes", 0) for t in statement.tables)
+    rows = explain_rows(conn=conn, query=query)
+    if rows is None:
+        _logger.debug(f"Can't explain statement, using table size: {query}")
+        rows = table_rows
+    row_length = table_bytes / table_rows if table_rows else 0
+    statement.rows = rows
+    statement.bytes = int(rows * row_length)
+    statement.cost = rows / rows_per_sec + statement.bytes / bytes_per_sec
+    _logger.trace(f"Statement {position} estimated cost: {statement.cost:.2f}s")
+    return statement
+
+
+def group_statements(statements: list) -> list:
+    """
+    Group statements sharing tables, so they keep file order
+    and groups are independent from each other
+    """
+    parents = {}
+
+    def find(table: str) -> str:
+        while parents.setdefault(table, table) != table:
+            parents[table] = parents[parents[table]]
+            table = parents[table]
+        return table
+
+    for statement in statements:
+        for table in statement.tables[1:]:
+            parents[find(table)] = find(statement.tables[0])
+    groups = {}
+    for statement in statements:
+        key = find(statement.tables[0]) if statement.tables else f"#{statement.position}"
+        groups.setdefault(key, StatementGroup()).statements.append(statement)
+    return list(groups.values())
+
+
+def split_phases(statements: list) -> list:
+    """
+    Split statements to phases at barrier statements,
+    barrier runs alone after everything before it
+    """
+    phases = [[]]
+    for statement in statements:
+        if statement.barrier:
+            phases.append([statement])
+            phases.append([])
+        else:
+            phases[-1].append(statement)
+    return [p for p in phases if p]
+
+
+def merge_small_groups(groups: list, batch_size: int, max_cost: float) -> list:
+    """
+    Merge independent groups of small DML statements, so they can share
+    transaction batches
+    """
+    if batch_size <= 1:
+        return groups
+    merged = []
+    small = StatementGroup()
+    for group in groups:
+        if any(s.cost > max_cost or not s.dml for s in group.statements):
+            merged.append(group)
+            continue
+        small.statements.extend(group.statements)
+        if len(small.statements) >= batch_size:
+            merged.append(small)
+            small = StatementGroup()
+    if small.statements:
+        merged.append(small)
+    return sorted(merged, key=lambda g: g.cost, reverse=True)
+
+
+def predict_wall_time(groups: list, workers: int) -> float:
+    """
+    Predict wall time when groups are dispatched longest first
+    to a pool of workers
+    """
+    loads = [0.0] * max(workers, 1)
+    for group in groups:
+        heapq.heapreplace(loads, loads[0] + group.cost)
+    return max(loads)
+
+
+def build_plan(
+        conn: sqlalchemy.engine.Connection,
+        queries: list,
+        workers: int) -> Plan:
+    """
+    Estimate every statement and order groups of each phase longest first
+    """
+    stats = table_stats(conn=conn)
+    statements = [estimate_statement(conn=conn, query=q, position=i, stats=stats) for i, q in enumerate(queries)]
+    phases = [
+        sorted(group_statements(p), key=lambda g: g.cost, reverse=True)
+        for p in split_phases(statements)]
+    return Plan(
+        phases=phases,
+        workers=workers,
+        wall_time=sum(predict_wall_time(groups=p, workers=workers) for p in phases),
+        serial_time=sum(g.cost for p in phases for g in p))
+
+
+def format_plan(plan: Plan) -> list:
+    """
+    Format plan to printable lines
+    """
+    lines = []
+    for i, phase in enumerate(plan.phases):
+        if len(plan.phases) > 1:
+            lines.append(f"Phase {i + 1}:")
+        for j, group in enumerate(phase):
+            lines.append(f"Group {j + 1}: estimated {group.cost:.2f}s")
+            for s in group.statements:
+                lines.append(f"  [{s.position + 1}] rows: {s.rows} bytes: {s.bytes} cost: {s.cost:.2f}s {s.query.strip()[:80]}")
+    lines.append(f"Serial time: {plan.serial_time:.2f}s")
+    lines.append(f"Predicted wall time with {plan.workers} workers: {plan.wall_time:.2f}s")
+    return lines
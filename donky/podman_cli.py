@@ -5,6 +5,18 @@ import subprocess
 import logging
 from donky.exceptions import ContainerNotCreated, VolumeAlreadyExistt
 import json
+import functools
+
+IMAGE_CACHE_TTL = 600
+_IMAGES = {}
+
+
+@functools.lru_cache()
+def podman_client() -> podman.PodmanClient:
+    """
+    Podman client shared by all containers in process
+    """
+    return podman.PodmanClient()
 
 
 class PodmanContainer():
@@ -14,7 +26,7 @@ class PodmanContainer():
             socket: str,
             registry: str,
             **kwargs):
-        self.client = podman.PodmanClient()
+        self.client = podman_client()
         self.image: podman.domain.images.Image = None
         self.container: podman.domain.containers.Container = None
         self.volume: podman.domain.volumes.Volume = None
@@ -91,29 +103,48 @@ class PodmanContainer():
 
     def __init_image(self, image: str, tag: str) -> podman.domain.images.Image:
         image = f"{self.registry}/{image}"
+        cached, pulled = _IMAGES.get(f"{image}:{tag}", (None, 0))
+        if cached is not None and time.monotonic() - pulled < IMAGE_CACHE_TTL:
+            self._logger.debug(f"Image {image}:{tag} already pulled")
+            return cached
         self._logger.info(f"Updating image: {image}:{tag}")
-        return self.client.images.pull(repository=image, tag=tag)
+        _IMAGES[f"{image}:{tag}"] = (self.client.images.pull(repository=image, tag=tag), time.monotonic())
+        return _IMAGES[f"{image}:{tag}"][0]
+
+    def image_updated(self, image: str, tag: str) -> bool:
+        """
+        Check whether tag points to other image than container was created from
+        """
+        return self.__init_image(image=image, tag=tag).id != self.image.id
 
     def __init_volume(
             self,
             name: str,
             bind: str,
             mode: str = "ro",
-            force: bool = False) -> podman.domain.volumes.Volume:
+            force: bool = False,
+            storage: str = "disk",
+            path: str = None,
+            size: int = None) -> podman.domain.volumes.Volume:
         volume_data = {
             name: {
                 "bind": bind,
-                "mode": mode,
-                "device": "/backups/podman-volumes/"
+                "mode": mode
                 }
             }
+        options = {}
+        if storage == "tmpfs":
+            options = {"type": "tmpfs", "device": "tmpfs", "o": f"size={size}"}
+        elif path is not None:
+            os.makedirs(path, exist_ok=True)
+            options = {"type": "none", "device": path, "o": "bind"}
         if self.client.volumes.exists(name):
             if not force:
                 raise VolumeAlreadyExistt(f"Volume: {name} already exists")
             self._logger.warning(f"volume {name} exists, force removing")
             self.client.volumes.remove(name=name, force=force)
-        self._logger.info(f"Creating volume: {name}")
-        volume = self.client.volumes.create(name=name)
+        self._logger.info(f"Creating {storage} volume: {name}")
+        volume = self.client.volumes.create(name=name, driver="local", options=options)
         self.container_config["volumes"] = volume_data
         return volume
 
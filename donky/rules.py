@@ -0,0 +1,198 @@
+import hashlib
+import hmac
+import logging
+import yaml
+import sqlalchemy
+from donky.verify import quote_table
+
+YAML_SUFFIXES = (".yaml", ".yml")
+DATE_TYPES = [
+    "date",
+    "datetime",
+    "timestamp"
+]
+
+
+def _quote(value: str) -> str:
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def derive_salt(key: str) -> str:
+    """
+    Derive rule salt from transform key, statements are logged,
+    so key itself must not appear in them
+    """
+    if key is None:
+        return None
+    return hmac.new(key.encode(), b"donky-rules", hashlib.sha256).hexdigest()
+
+
+def _salt(rule: dict) -> str:
+    # Unsalted hash of known values (emails, ids) is reversible by lookup
+    if not rule.get("salt"):
+        raise ValueError(f"Transform {rule['transform']} needs salt option or transform_key")
+    return _quote(rule["salt"])
+
+
+def _hash(col: str, rule: dict) -> str:
+    return f"LEFT(SHA2(CONCAT({_salt(rule)}, {col}), 256), {int(rule.get('length', 64))})"
+
+
+def _email(col: str, rule: dict) -> str:
+    return f"CONCAT({_hash(col, rule)}, '@', {_quote(rule.get('domain', 'example.com'))})"
+
+
+def _digits(col: str, rule: dict) -> str:
+    # Nested REPLACE instead of REGEXP_REPLACE, which needs MySQL 8.0
+    mask = _quote(rule.get("mask", "0"))
+    expression = col
+    for digit in "0123456789":
+        expression = f"REPLACE({expression}, '{digit}', {mask})"
+    return expression
+
+
+def _date_shift(col: str, rule: dict) -> str:
+    days = int(rule.get("days", 30))
+    entity = f"`{rule['entity']}`" if "entity" in rule.keys() else "0"
+    offset = f"CAST(CRC32(CONCAT({_salt(rule)}, {entity})) % {2 * days + 1} AS SIGNED) - {days}"
+    return f"DATE_ADD({col}, INTERVAL {offset} DAY)"
+
+
+def _set(col: str, rule: dict) -> str:
+    return _quote(rule["value"])
+
+
+def _expression(col: str, rule: dict) -> str:
+    return rule["sql"]
+
+
+SQL_TRANSFORMS = {
+    "hash": _hash,
+    "email": _email,
+    "digits": _digits,
+    "date_shift": _date_shift,
+    "set": _set,
+    "expression": _expression,
+    "null": None,
+}
+
+
+def is_rule_file(path: str) -> bool:
+    return path.endswith(YAML_SUFFIXES)
+
+
+def load_rules(path: str) -> dict:
+    """
+    Load yaml rule file:
+    tables:
+      <schema>.<table>:
+        where: <optional condition>
+        columns:
+          <column>: <transform> or {transform: <transform>, <option>: <value>}
+    """
+    with open(path, "r") as file:
+        data = yaml.safe_load(file) or {}
+    tables = data.get("tables") or {}
+    rules = {}
+    for table, table_rules in tables.items():
+        columns = {}
+        for column, rule in (table_rules.get("columns") or {}).items():
+            rule = {"transform": rule} if not isinstance(rule, dict) else rule
+            if rule.get("transform") is None:
+                rule["transform"] = "null"
+            if rule["transform"] not in SQL_TRANSFORMS.keys():
+                raise ValueError(f"Unknown transform: {rule['transform']} for {table}.{column}")
+            columns[column] = rule
+        rules[table] = {"where": table_rules.get("where"), "columns": columns}
+    return rules
+
+
+def compile_column(column: str, rule: dict, salt: str = None) -> str:
+    """
+    Compile column rule to SET assignment, NULL values stay NULL.
+    Salt is used by hashing transforms without own salt option
+    """
+    col = f"`{column}`"
+    transform = SQL_TRANSFORMS[rule["transform"]]
+    if transform is None:
+        return f"{col} = NULL"
+    if not rule.get("salt"):
+        rule = {**rule, "salt": salt}
+    expression = transform(col, rule)
+    if rule["transform"] in ("set", "expression"):
+        return f"{col} = {expression}"
+    return f"{col} = IF({col} IS NULL, NULL, {expression})"
+
+
+def compile_rules(rules: dict, exclude: dict = None, salt: str = None) -> list:
+    """
+    Compile rules to one UPDATE per table, columns used as date shift
+    entity are assigned last, so shifts see original values.
+    Rows matching exclude condition of table are left untouched
+    """
+    statements = []
+    for table, table_rules in rules.items():
+        columns = table_rules["columns"]
+        skip = (exclude or {}).get(table)
+        if len(columns) == 0 or skip == "1=1":
+            continue
+        entities = {r.get("entity") for r in columns.values() if "entity" in r.keys()}
+        ordered = sorted(columns.keys(), key=lambda c: c in entities)
+        assignments = ",\n    ".join(compile_column(column=c, rule=columns[c], salt=salt) for c in ordered)
+        statement = f"UPDATE {quote_table(table)} SET\n    {assignments}"
+        conditions = [table_rules["where"]] if table_rules.get("where") else []
+        if skip:
+            conditions.append(f"NOT ({skip})")
+        if len(conditions) == 1:
+            statement += f"\nWHERE {conditions[0]}"
+        elif len(conditions) > 1:
+            statement += "\nWHERE " + " AND ".join(f"({c})" for c in conditions)
+        statements.append(statement)
+    return statements
+
+
+def check_overlap(rules: dict, transforms: list) -> None:
+    """
+    Reject columns which have both yaml rule and export transform,
+    export would transform already obfuscated value again
+    """
+    overlap = []
+    for transform in transforms:
+        for table, table_rules in rules.items():
+            if transform.table in (table, table.split(".", 1)[-1]) and transform.column in table_rules["columns"].keys():
+                overlap.append(f"{table}.{transform.column}")
+    if overlap:
+        raise ValueError(f"Columns have both rules_file rule and transform: {', '.join(sorted(set(overlap)))}")
+
+
+def check_rules(conn: sqlalchemy.engine.Connection, rules: dict) -> None:
+    """
+    Check rules against live schema
+    """
+    _logger = logging.getLogger("Donky")
+    query = """
+        SELECT column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = :schema AND table_name = :name
+        """
+    errors = []
+    for table, table_rules in rules.items():
+        if "." not in table:
+            errors.append(f"Table {table} must be <schema>.<table>")
+            continue
+        schema, name = table.split(".", 1)
+        columns = {r[0]: r[1] for r in conn.execute(sqlalchemy.text(query), {"schema": schema, "name": name})}
+        if len(columns) == 0:
+            errors.append(f"Table {table} doesn't exist")
+            continue
+        for column, rule in table_rules["columns"].items():
+            if column not in columns.keys():
+                errors.append(f"Column {table}.{column} doesn't exist")
+            elif rule["transform"] == "date_shift" and columns[column] not in DATE_TYPES:
+                errors.append(f"Column {table}.{column} is {columns[column]}, date_shift needs date type")
+            if "entity" in rule.keys() and rule["entity"] not in columns.keys():
+                errors.append(f"Entity column {table}.{rule['entity']} doesn't exist")
+    for error in errors:
+        _logger.error(error)
+    if errors:
+        raise ValueError(f"Rule file doesn't match schema, {len(errors)} errors")
@@ -0,0 +1,120 @@
+import json
+import logging
+from donky.obfuscator import DEFAULT_PORT, DEFAULT_SQL_FILE, Obfuscator
+from donky.containers import Container
+from donky.config import Donky, Obfuscators
+from donky.helpers import create_mysql_container, create_volume_holder, resolve_storage, restore_backup
+from donky.backups import resolve_backup
+from donky.verify import sensitive_columns
+from donky.rules import is_rule_file, load_rules
+
+
+def update_obfuscator(obfuscator: Obfuscator, data: dict) -> None:
+    for key, value in data.items():
+        obfuscator.__setattr__(key, value)
+
+
+def init_obfuscator(config: Donky, name: str, obfuscator: Obfuscators) -> Obfuscator:
+    """
+    Create db obfuscator from config section
+    """
+    return Obfuscator(
+        proc=int(config.num_process),
+        port=obfuscator.port or DEFAULT_PORT,
+        sql_file=obfuscator.rules_file or DEFAULT_SQL_FILE,
+        bloom_file=f"{config.tmp}/donky_{name}.bloom",
+        verify_columns=sensitive_columns(
+            verify_columns=obfuscator.verify_columns,
+            transforms=obfuscator.transforms,
+            rules=load_rules(path=obfuscator.rules_file) if obfuscator.rules_file and is_rule_file(obfuscator.rules_file) else None),
+        verify_sample=int(obfuscator.verify_sample),
+        output_dir=obfuscator.output_dir,
+        chunk_size=int(obfuscator.chunk_size),
+        transforms=obfuscator.transforms,
+        transform_key=obfuscator.transform_key,
+        transform_seed=obfuscator.transform_seed,
+        concurrency=config.concurrency,
+        min_proc=int(config.min_process),
+        max_proc=int(config.max_process or config.num_process),
+        batch_size=int(obfuscator.batch_size),
+        batch_max_cost=float(obfuscator.batch_max_cost))
+
+
+def run_obfuscator(
+        config: Donky,
+        name: str,
+        obfuscator: Obfuscators,
+        mysql_container: Container = None) -> Container:
+    """
+    Restore newest backup and obfuscate it, already bootstrapped
+    mysql container is reused when server version matches.
+    Returns mysql container
+    """
+    _logger = logging.getLogger("Donky")
+    _logger.info(f"Obfuscating {name}")
+    _logger.trace(f"Obfuscator:\n{json.dumps(obfuscator.dump(), indent=2)}")
+    mysql_con_name = f"mysql_{name}"
+    _logger.info("Resolving backup")
+    backup = resolve_backup(
+            backup_type=obfuscator.backup_type,
+            backup_path=obfuscator.backup_source,
+            name_pattern=obfuscator.search_name,
+            threads=int(config.num_process),
+            cache_file=f"{config.tmp}/donky_backup_checks.json")
+    update_obfuscator(obfuscator=obfuscator, data=backup)
+    _logger.debug(f"Obfuscator:\n{json.dumps(obfuscator.dump(), indent=2)}")
+    if mysql_container is not None:
+        storage = resolve_storage(
+            storage=obfuscator.storage,
+            restored_size=obfuscator.restored_size,
+            memory_budget=obfuscator.memory_budget)
+        if mysql_container.image_tag != obfuscator.server_version:
+            _logger.info(f"Server version changed to {obfuscator.server_version}, recreating mysql container")
+            mysql_container = None
+        elif mysql_container.storage != storage:
+            _logger.info(f"Storage changed to {storage}, recreating mysql container")
+            mysql_container = None
+        elif mysql_container.image_updated():
+            _logger.info(f"Image {mysql_container.image}:{mysql_container.image_tag} updated, recreating mysql container")
+            mysql_container = None
+    if mysql_container is None:
+        _logger.info("Creating mysql container")
+        mysql_container = create_mysql_container(
+                name=mysql_con_name,
+                engine=config.container_engine,
+                con_data=obfuscator.__dict__)
+    else:
+        _logger.info(f"Reusing mysql container: {mysql_container.name}")
+    holder = None
+    if mysql_container.storage == "tmpfs":
+        _logger.info("Keeping tmpfs datadir mounted during restore")
+        holder = create_volume_holder(
+                name=f"holder_{name}",
+                container=mysql_container,
+                engine=config.container_engine)
+        holder.start()
+        holder.wait(state="running")
+    try:
+        mysql_container.stop()
+        _logger.info("Creating xtrbakuo container")
+        restore = restore_backup(
+                name=f"xtrabackup_{name}",
+                backup_file=obfuscator.backup_file,
+                incremental_files=obfuscator.incremental_files,
+                volumes_from=mysql_con_name,
+                version=obfuscator.tool_version,
+                registry=obfuscator.registry,
+                engine=config.container_engine,
+                recreate=True)
+        _logger.debug("Starting backup restore")
+        restore.start()
+        restore.wait(state="exited")
+        _logger.debug("Restore finished")
+        mysql_container.start()
+        mysql_container.wait(state="running")
+    finally:
+        if holder is not None:
+            holder.stop()
+    db_obfuscator = init_obfuscator(config=config, name=name, obfuscator=obfuscator)
+    db_obfuscator.obfuscate()
+    return mysql_container
@@ -0,0 +1,219 @@
+import dataclasses
+import functools
+import hashlib
+import re
+import numpy
+
+HEX_DIGITS = numpy.array([ord(c) for c in "0123456789abcdef"], dtype=numpy.uint32)
+HASH_VERSION = "2"
+DEFAULT_DATE_SHIFT_DAYS = 30
+
+
+@dataclasses.dataclass
+class TransformRule():
+    """
+    Dataclass for column transform rule
+    """
+    table: str
+    column: str
+    transform: str
+    args: list = dataclasses.field(default_factory=list)
+
+
+def _seed(key: str, seed: str) -> numpy.uint64:
+    """
+    Derive hashing seed from secret key and seed
+    """
+    digest = hashlib.blake2b(f"{key}:{seed}".encode(), digest_size=8).digest()
+    return numpy.uint64(int.from_bytes(digest, "little"))
+
+
+def _code_points(values: numpy.ndarray) -> tuple:
+    """
+    Concatenate string values to flat array of unicode code points without
+    padding, returns code points, start offset and length of every value
+    """
+    strings = [v if isinstance(v, str) else str(v) for v in numpy.asarray(values, dtype=object)]
+    lengths = numpy.fromiter(map(len, strings), dtype=numpy.int64, count=len(strings))
+    points = numpy.frombuffer("".join(strings).encode("utf-32-le", "surrogatepass"), dtype=numpy.uint32)
+    return points, numpy.cumsum(lengths) - lengths, lengths
+
+
+def _positions(starts: numpy.ndarray, lengths: numpy.ndarray) -> numpy.ndarray:
+    """
+    Position of every flat code point inside its value
+    """
+    return (numpy.arange(lengths.sum(), dtype=numpy.int64) - numpy.repeat(starts, lengths)).astype(numpy.uint64)
+
+
+def _null_mask(values: numpy.ndarray) -> numpy.ndarray:
+    values = numpy.asarray(values)
+    if values.dtype != object:
+        return numpy.zeros(len(values), dtype=bool)
+    return numpy.equal(values, None)
+
+
+def _restore_nulls(result: numpy.ndarray, nulls: numpy.ndarray) -> numpy.ndarray:
+    if not nulls.any():
+        return result
+    result = result.astype(object)
+    result[nulls] = None
+    return result
+
+
+def _mix(h: numpy.ndarray) -> numpy.ndarray:
+    """
+    splitmix64 finalizer
+    """
+    h = h ^ (h >> numpy.uint64(30))
+    h = h * numpy.uint64(0xbf58476d1ce4e5b9)
+    h = h ^ (h >> numpy.uint64(27))
+    h = h * numpy.uint64(0x94d049bb133111eb)
+    return h ^ (h >> numpy.uint64(31))
+
+
+def hash_values(values: numpy.ndarray, key: str, seed: str = "0") -> numpy.ndarray:
+    """
+    Keyed 64 bit hash of every value, each code point is mixed with its
+    position and summed per value, so work and memory follow total length
+    """
+    points, starts, lengths = _code_points(values)
+    seed = _seed(key=key, seed=seed)
+    with numpy.errstate(over="ignore"):
+        mixed = _mix(((_positions(starts, lengths) << numpy.uint64(32)) | points) ^ seed)
+        totals = numpy.concatenate((numpy.zeros(1, dtype=numpy.uint64), numpy.cumsum(mixed, dtype=numpy.uint64)))
+        sums = totals[starts + lengths] - totals[starts]
+        return _mix(sums + _mix(lengths.astype(numpy.uint64) ^ seed))
+
+
+def keyed_hash(values: numpy.ndarray, key: str, seed: str, batch: dict) -> numpy.ndarray:
+    """
+    Replace values with hex encoded keyed hash
+    """
+    shifts = numpy.arange(60, -1, -4, dtype=numpy.uint64)
+    h = hash_values(values=values, key=key, seed=seed)
+    digits = HEX_DIGITS[((h[:, None] >> shifts) & numpy.uint64(0xf)).astype(numpy.intp)]
+    result = numpy.ascontiguousarray(digits).view("<U16").ravel()
+    return _restore_nulls(result=result, nulls=_null_mask(values))
+
+
+def digit_mask(values: numpy.ndarray, key: str, seed: str, batch: dict) -> numpy.ndarray:
+    """
+    Format preserving mask, replaces every digit and keeps other characters
+    """
+    points, starts, lengths = _code_points(values)
+    points = points.copy()
+    h = hash_values(values=values, key=key, seed=seed)
+    with numpy.errstate(over="ignore"):
+        stream = (_mix(numpy.repeat(h, lengths) + _positions(starts, lengths)) % numpy.uint64(10)).astype(numpy.uint32)
+    digits = (points >= ord("0")) & (points <= ord("9"))
+    points[digits] = ord("0") + (points[digits] - ord("0") + stream[digits]) % 10
+    text = points.tobytes().decode("utf-32-le", "surrogatepass")
+    result = numpy.array([text[s:s + n] for s, n in zip(starts, lengths)], dtype=object)
+    return _restore_nulls(result=result, nulls=_null_mask(values))
+
+
+def date_shift(
+        values: numpy.ndarray,
+        key: str,
+        seed: str,
+        batch: dict,
+        entity_column: str = None,
+        max_days: str = DEFAULT_DATE_SHIFT_DAYS) -> numpy.ndarray:
+    """
+    Shift dates by offset derived from entity column, so all dates
+    of same entity keep their intervals
+    """
+    nulls = _null_mask(values)
+    dates = numpy.asarray(values, dtype="datetime64[us]")
+    entities = values if entity_column is None else batch[entity_column]
+    span = numpy.uint64(2 * int(max_days) + 1)
+    offsets = (hash_values(values=entities, key=key, seed=seed) % span).astype(numpy.int64) - int(max_days)
+    result = dates + offsets.astype("timedelta64[D]")
+    return _restore_nulls(result=result, nulls=nulls)
+
+
+def nullify(values: numpy.ndarray, key: str, seed: str, batch: dict) -> numpy.ndarray:
+    """
+    Replace all values with NULL
+    """
+    return numpy.full(len(values), None, dtype=object)
+
+
+@functools.lru_cache()
+def load_dictionary(path: str) -> numpy.ndarray:
+    """
+    Load substitution dictionary, one value per line
+    """
+    with open(path, "r") as file:
+        words = [line.strip() for line in file.readlines()]
+    words = [w for w in words if w]
+    if len(words) == 0:
+        raise ValueError(f"Dictionary {path} is empty")
+    return numpy.array(words)
+
+
+def substitute(values: numpy.ndarray, key: str, seed: str, batch: dict, dictionary: str = None) -> numpy.ndarray:
+    """
+    Replace values with dictionary words picked by keyed hash
+    """
+    if dictionary is None:
+        raise ValueError("Substitute transform requires dictionary file")
+    words = load_dictionary(path=dictionary)
+    h = hash_values(values=values, key=key, seed=seed)
+    result = words[(h % numpy.uint64(len(words))).astype(numpy.intp)]
+    return _restore_nulls(result=result, nulls=_null_mask(values))
+
+
+TRANSFORMS = {
+    "hash": keyed_hash,
+    "digits": digit_mask,
+    "date_shift": date_shift,
+    "null": nullify,
+    "substitute": substitute,
+}
+
+
+def parse_rules(spec: str) -> list:
+    """
+    Parse transform rules from config, entries separated by new line or comma:
+    <table>.<column> = <transform>[:<arg>...]
+    """
+    rules = []
+    for entry in re.split(r"[,\n]", spec):
+        if not entry.strip():
+            continue
+        target, _, transform = entry.partition("=")
+        table, _, column = target.strip().rpartition(".")
+        name, *args = transform.strip().split(":")
+        if not table or not column:
+            raise ValueError(f"Transform target: {target.strip()} must be <table>.<column>")
+        if name not in TRANSFORMS.keys():
+            raise ValueError(f"Unknown transform: {name}, use one of: {', '.join(TRANSFORMS.keys())}")
+        rules.append(TransformRule(table=table, column=column, transform=name, args=args))
+    return rules
+
+
+def transform_batch(
+        table: str,
+        batch: dict,
+        rules: list,
+        key: str,
+        seed: str = "0") -> dict:
+    """
+    Apply table rules to fetched batch of columns,
+    batch is dict of column name and array of values,
+    rules match by <schema>.<table> or bare table name
+    """
+    result = dict(batch)
+    for rule in rules:
+        if rule.table not in (table, table.split(".")[-1]):
+            continue
+        if rule.column not in batch.keys():
+            raise ValueError(f"Column {rule.column} not in {table} batch")
+        values = numpy.asarray(batch[rule.column])
+        if len(values) == 0:
+            continue
+        transform = TRANSFORMS[rule.transform]
+        result[rule.column] = transform(values, key, seed, batch, *rule.args)
+    return result
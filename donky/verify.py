@@ -0,0 +1,182 @@
+import logging
+import math
+import secrets
+import sys
+import numpy
+import sqlalchemy
+from donky.planner import SYSTEM_SCHEMAS
+from donky.transforms import hash_values, parse_rules
+
+DEFAULT_SAMPLE_SIZE = 100000
+DEFAULT_ERROR_RATE = 0.001
+DEFAULT_BATCH_SIZE = 10000
+TEXT_TYPES = [
+    "char",
+    "varchar",
+    "tinytext",
+    "text",
+    "mediumtext",
+    "longtext"
+]
+
+
+def _lengths(values: numpy.ndarray) -> numpy.ndarray:
+    return numpy.fromiter((len(v if isinstance(v, str) else str(v)) for v in values), dtype=numpy.int64, count=len(values))
+
+
+class BloomFilter():
+    """
+    Bloom filter over string values, all operations work on whole batches,
+    values longer than longest added one are never hashed
+    """
+
+    def __init__(
+            self,
+            capacity: int,
+            error_rate: float = DEFAULT_ERROR_RATE,
+            key: str = None,
+            bits: numpy.ndarray = None,
+            hashes: int = None,
+            max_length: int = 0):
+        capacity = max(capacity, 1)
+        self.max_length = max_length
+        self.size = int(-capacity * math.log(error_rate) / math.log(2) ** 2) + 1
+        self.hashes = hashes or max(int(round(self.size / capacity * math.log(2))), 1)
+        self.key = key or secrets.token_hex(16)
+        self.bits = bits if bits is not None else numpy.zeros(self.size // 8 + 1, dtype=numpy.uint8)
+        self.size = (len(self.bits) - 1) * 8
+
+    def _positions(self, values: numpy.ndarray) -> numpy.ndarray:
+        h1 = hash_values(values=values, key=self.key, seed="bloom1")
+        h2 = hash_values(values=values, key=self.key, seed="bloom2") | numpy.uint64(1)
+        rounds = numpy.arange(self.hashes, dtype=numpy.uint64)
+        with numpy.errstate(over="ignore"):
+            positions = (h1[:, None] + rounds[None, :] * h2[:, None]) % numpy.uint64(self.size)
+        return positions.astype(numpy.int64)
+
+    def add(self, values: numpy.ndarray) -> None:
+        if len(values) == 0:
+            return
+        self.max_length = max(self.max_length, int(_lengths(values).max()))
+        positions = self._positions(values).ravel()
+        numpy.bitwise_or.at(self.bits, positions >> 3, (1 << (positions & 7)).astype(numpy.uint8))
+
+    def contains(self, values: numpy.ndarray) -> numpy.ndarray:
+        result = numpy.zeros(len(values), dtype=bool)
+        candidates = _lengths(values) <= self.max_length
+        if not candidates.any():
+            return result
+        positions = self._positions(numpy.asarray(values)[candidates])
+        found = (self.bits[positions >> 3] >> (positions & 7).astype(numpy.uint8)) & 1
+        result[candidates] = found.all(axis=1)
+        return result
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as file:
+            numpy.savez(file, bits=self.bits, hashes=self.hashes, key=self.key, max_length=self.max_length)
+
+    @classmethod
+    def load(cls, path: str) -> "BloomFilter":
+        with numpy.load(path) as data:
+            return cls(
+                capacity=1,
+                key=str(data["key"]),
+                bits=data["bits"],
+                hashes=int(data["hashes"]),
+                max_length=int(data["max_length"]) if "max_length" in data.files else sys.maxsize)
+
+
+def quote_table(table: str) -> str:
+    return ".".join(f"`{t}`" for t in table.split("."))
+
+
+def sensitive_columns(verify_columns: str = None, transforms: str = None, rules: dict = None) -> list:
+    """
+    Get sensitive columns from verify_columns setting or
+    fallback to columns which have transform or yaml rules
+    """
+    columns = []
+    if verify_columns is not None:
+        targets = [c.strip() for c in verify_columns.replace("\n", ",").split(",") if c.strip()]
+        columns = [tuple(c.rsplit(".", 1)) for c in targets]
+    else:
+        if transforms is not None:
+            columns += [(r.table, r.column) for r in parse_rules(spec=transforms)]
+        for table, table_rules in (rules or {}).items():
+            columns += [(table, c) for c in table_rules["columns"].keys() if (table, c) not in columns]
+    for column in columns:
+        if len(column) != 2:
+            raise ValueError(f"Verify column: {column[0]} must be <table>.<column>")
+    return columns
+
+
+def stream_rows(
+        conn: sqlalchemy.engine.Connection,
+        query: str,
+        batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    Stream query results as object arrays, one batch at a time
+    """
+    result = conn.execution_options(stream_results=True).execute(sqlalchemy.text(query))
+    for rows in result.partitions(batch_size):
+        yield numpy.array(rows, dtype=object).reshape(len(rows), -1)
+
+
+def build_filter(
+        conn: sqlalchemy.engine.Connection,
+        columns: list,
+        sample_size: int = DEFAULT_SAMPLE_SIZE,
+        error_rate: float = DEFAULT_ERROR_RATE) -> BloomFilter:
+    """
+    Sample original sensitive values into bloom filter
+    """
+    _logger = logging.getLogger("Donky")
+    bloom = BloomFilter(capacity=sample_size * len(columns), error_rate=error_rate)
+    for table, column in columns:
+        _logger.debug(f"Sampling {table}.{column}")
+        query = f"SELECT `{column}` FROM {quote_table(table)} WHERE `{column}` IS NOT NULL AND `{column}` <> '' LIMIT {sample_size}"
+        for batch in stream_rows(conn=conn, query=query):
+            bloom.add(batch[:, 0])
+    return bloom
+
+
+def text_columns(conn: sqlalchemy.engine.Connection) -> dict:
+    """
+    Get text columns of all user tables
+    """
+    types = ", ".join(f"'{t}'" for t in TEXT_TYPES)
+    query = f"""
+        SELECT c.table_schema, c.table_name, c.column_name
+        FROM information_schema.columns c
+        JOIN information_schema.tables t
+          ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+        WHERE t.table_type = 'BASE TABLE' AND c.data_type IN ({types})
+        """
+    tables = {}
+    for row in conn.execute(sqlalchemy.text(query)).mappings():
+        row = {k.lower(): v for k, v in row.items()}
+        if row["table_schema"] in SYSTEM_SCHEMAS:
+            continue
+        tables.setdefault(f"{row['table_schema']}.{row['table_name']}", []).append(row["column_name"])
+    return tables
+
+
+def scan_table(
+        conn: sqlalchemy.engine.Connection,
+        table: str,
+        columns: list,
+        bloom: BloomFilter,
+        condition: str = "1=1",
+        batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    Count values in table text columns found in bloom filter,
+    condition limits scan to part of table
+    """
+    select = ", ".join(f"`{c}`" for c in columns)
+    query = f"SELECT {select} FROM {quote_table(table)} WHERE {condition}"
+    leaks = 0
+    for batch in stream_rows(conn=conn, query=query, batch_size=batch_size):
+        values = batch.ravel()
+        values = values[numpy.not_equal(values, None)]
+        leaks += int(bloom.contains(values).sum())
+    return leaks
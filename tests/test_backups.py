@@ -0,0 +1,105 @@
+import os
+import pytest
+from donky.backups import binary_backup_info, incremental_chain
+from donky.exceptions import BackupNotFoundError, IncrementalBackupError
+
+
+def backup(name: str, from_lsn: int, to_lsn: int, incremental: bool = True) -> dict:
+    return {
+        "backup_info_file": name,
+        "incremental": "Y" if incremental else "N",
+        "innodb_from_lsn": str(from_lsn),
+        "innodb_to_lsn": str(to_lsn),
+    }
+
+
+@pytest.fixture
+def ctime(monkeypatch):
+    """
+    Backup age by position in created list, newest last
+    """
+    created = []
+    monkeypatch.setattr(os.path, "getctime", lambda f: created.index(f))
+    return created
+
+
+def chain_names(full: dict, backups: list) -> list:
+    return [b["backup_info_file"] for b in incremental_chain(full=full, backups=backups)]
+
+
+def test_chain(ctime):
+    ctime.extend(["full", "inc1", "inc2"])
+    full = backup("full", 0, 100, incremental=False)
+    backups = [backup("inc2", 200, 300), backup("inc1", 100, 200)]
+    assert chain_names(full=full, backups=backups) == ["inc1", "inc2"]
+
+
+def test_branching_chain_takes_newest(ctime):
+    ctime.extend(["full", "old", "new", "next"])
+    full = backup("full", 0, 100, incremental=False)
+    backups = [backup("old", 100, 200), backup("new", 100, 250), backup("next", 250, 300)]
+    assert chain_names(full=full, backups=backups) == ["new", "next"]
+
+
+def test_missing_link_ends_chain(ctime):
+    ctime.extend(["full", "inc1", "inc3"])
+    full = backup("full", 0, 100, incremental=False)
+    backups = [backup("inc1", 100, 200), backup("inc3", 300, 400)]
+    assert chain_names(full=full, backups=backups) == ["inc1"]
+
+
+def test_incremental_without_writes_is_used_once(ctime):
+    ctime.extend(["full", "inc1", "inc2", "inc3"])
+    full = backup("full", 0, 100, incremental=False)
+    backups = [backup("inc1", 100, 200), backup("inc2", 200, 200), backup("inc3", 200, 300)]
+    assert chain_names(full=full, backups=backups[:2]) == ["inc1", "inc2"]
+    assert chain_names(full=full, backups=backups) == ["inc1", "inc3"]
+
+
+def test_lsn_going_back(ctime):
+    ctime.extend(["full", "inc1"])
+    full = backup("full", 0, 100, incremental=False)
+    with pytest.raises(IncrementalBackupError):
+        incremental_chain(full=full, backups=[backup("inc1", 100, 50)])
+
+
+def test_missing_lsn(ctime):
+    full = {"backup_info_file": "full", "incremental": "N"}
+    with pytest.raises(IncrementalBackupError):
+        incremental_chain(full=full, backups=[])
+
+
+def write_info(path, from_lsn: int, to_lsn: int, incremental: bool) -> None:
+    path.mkdir()
+    (path / "xtrabackup_info").write_text("\n".join([
+        f"incremental = {'Y' if incremental else 'N'}",
+        f"innodb_from_lsn = {from_lsn}",
+        f"innodb_to_lsn = {to_lsn}",
+        "encrypted = N",
+        "partial = N",
+        "format = xbstream",
+        "compressed = compressed",
+        "server_version = 8.0.36-28",
+        "tool_version = 8.0.35-31",
+    ]) + "\n")
+
+
+def test_binary_backup_info(tmp_path, ctime):
+    write_info(tmp_path / "full", 0, 100, incremental=False)
+    write_info(tmp_path / "inc1", 100, 200, incremental=True)
+    write_info(tmp_path / "inc2", 200, 200, incremental=True)
+    ctime.extend(str(tmp_path / d / "xtrabackup_info") for d in ("full", "inc1", "inc2"))
+    info = binary_backup_info(path=str(tmp_path))
+    assert info["backup_info_file"] == str(tmp_path / "full" / "xtrabackup_info")
+    assert info["incremental_info_files"] == [
+        str(tmp_path / "inc1" / "xtrabackup_info"),
+        str(tmp_path / "inc2" / "xtrabackup_info"),
+    ]
+    assert info["server_version"] == "8.0"
+    assert info["compressed"] is True
+
+
+def test_binary_backup_info_without_full(tmp_path, ctime):
+    write_info(tmp_path / "inc1", 100, 200, incremental=True)
+    with pytest.raises(BackupNotFoundError):
+        binary_backup_info(path=str(tmp_path))
@@ -0,0 +1,81 @@
+import numpy
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from donky.chunks import (  # noqa: E402
+    WHOLE_TABLE_CHUNK,
+    chunk_condition,
+    chunks_condition,
+    format_column,
+    rules_hash,
+    unchanged_chunks
+)
+
+
+def manifest(tables: dict, rules: str = "r", chunk_size: int = 10) -> dict:
+    return {"rules_hash": rules, "chunk_size": chunk_size, "tables": tables}
+
+
+def table(pk: str = "id", **chunks) -> dict:
+    return {"primary_key": pk, "chunks": {c.lstrip("c"): {"rows": 1, "checksum": v} for c, v in chunks.items()}}
+
+
+def test_unchanged_chunks():
+    previous = manifest({"db.a": table(c0=1, c1=2, c2=3), "db.b": table(c0=5)})
+    current = manifest({"db.a": table(c0=1, c1=9, c2=3, c3=4), "db.b": table(c0=6)})
+    assert unchanged_chunks(manifest=current, previous=previous) == {"db.a": ["0", "2"]}
+
+
+def test_unchanged_chunks_without_previous_run():
+    assert unchanged_chunks(manifest=manifest({"db.a": table(c0=1)}), previous=None) == {}
+
+
+@pytest.mark.parametrize("previous", [
+    manifest({"db.a": table(c0=1)}, rules="other"),
+    manifest({"db.a": table(c0=1)}, chunk_size=20),
+    manifest({"db.a": table(pk="uuid", c0=1)}),
+    manifest({}),
+])
+def test_unchanged_chunks_invalidated(previous):
+    assert unchanged_chunks(manifest=manifest({"db.a": table(c0=1)}), previous=previous) == {}
+
+
+def test_unchanged_whole_table_chunk():
+    whole = {"primary_key": None, "chunks": {WHOLE_TABLE_CHUNK: {"rows": 3, "checksum": 7}}}
+    current = manifest({"db.a": whole})
+    assert unchanged_chunks(manifest=current, previous=manifest({"db.a": whole})) == {"db.a": [WHOLE_TABLE_CHUNK]}
+
+
+def test_chunk_condition():
+    assert chunk_condition(pk="id", chunk="3", chunk_size=10) == "`id` BETWEEN 30 AND 39"
+    assert chunk_condition(pk=None, chunk=WHOLE_TABLE_CHUNK, chunk_size=10) == "1=1"
+
+
+def test_chunks_condition_merges_consecutive_ranges():
+    condition = chunks_condition(pk="id", chunks=["4", "0", "1", "2", "7"], chunk_size=10)
+    assert condition == "`id` BETWEEN 0 AND 29 OR `id` BETWEEN 40 AND 49 OR `id` BETWEEN 70 AND 79"
+
+
+def test_chunks_condition_whole_table():
+    assert chunks_condition(pk=None, chunks=[WHOLE_TABLE_CHUNK], chunk_size=10) == "1=1"
+
+
+def test_rules_hash(tmp_path):
+    rules = tmp_path / "rules.sql"
+    rules.write_text("UPDATE t SET a = 1;")
+    base = rules_hash(files=[str(rules)], spec="t.a = hash", key="k", seed="0")
+    assert base == rules_hash(files=[str(rules)], spec="t.a = hash", key="k", seed="0")
+    assert base != rules_hash(files=[str(rules)], spec="t.a = digits", key="k", seed="0")
+    assert base != rules_hash(files=[str(rules)], spec="t.a = hash", key="other", seed="0")
+    assert base != rules_hash(files=[str(rules)], spec="t.a = hash", key="k", seed="1")
+    rules.write_text("UPDATE t SET a = 2;")
+    assert base != rules_hash(files=[str(rules)], spec="t.a = hash", key="k", seed="0")
+
+
+def test_format_column():
+    assert format_column(numpy.array([1, None], dtype=object)).tolist() == ["1", "\\N"]
+    assert format_column(numpy.array(["a\tb\nc\\", "\0"], dtype=object)).tolist() == ["a\\tb\\nc\\\\", "\\0"]
+    assert format_column(numpy.array([1.5, 2.0])).tolist() == ["1.5", "2.0"]
+    binary = format_column(numpy.array([b"\xff\n"], dtype=object))[0]
+    assert binary.encode("utf-8", "surrogateescape") == b"\xff\\n"
@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from donky.concurrency import AdaptiveController  # noqa: E402
+
+
+def status(rows: int, threads: int = 1, lock_waits: int = 0) -> dict:
+    return {"Innodb_rows_updated": rows, "Threads_running": threads, "Innodb_row_lock_waits": lock_waits}
+
+
+def run(controller: AdaptiveController, throughput, steps: int) -> list:
+    """
+    Feed controller with throughput depending on current limit
+    """
+    rows = 0
+    controller.update(elapsed=0, status=status(rows))
+    limits = []
+    for i in range(steps):
+        rows += throughput(controller.limit) * controller.interval
+        limits.append(controller.update(elapsed=controller.interval, status=status(rows, threads=controller.limit + 1)))
+    return limits
+
+
+def test_invalid_bounds():
+    with pytest.raises(ValueError):
+        AdaptiveController(min_workers=0, max_workers=4)
+    with pytest.raises(ValueError):
+        AdaptiveController(min_workers=4, max_workers=2)
+
+
+def test_first_update_only_records_status():
+    controller = AdaptiveController(min_workers=2, max_workers=8)
+    assert controller.update(elapsed=0, status=status(0)) == 2
+
+
+def test_climbs_to_max_while_throughput_grows():
+    controller = AdaptiveController(min_workers=1, max_workers=4)
+    assert run(controller, lambda limit: 1000 * limit, steps=6)[-1] == 4
+
+
+def test_settles_around_peak():
+    controller = AdaptiveController(min_workers=1, max_workers=16)
+    limits = run(controller, lambda limit: 1000 * limit if limit <= 6 else 6000 - 500 * (limit - 6), steps=40)
+    assert set(limits[-10:]) <= {5, 6, 7}
+
+
+def test_backs_off_when_threads_pile_up():
+    controller = AdaptiveController(min_workers=1, max_workers=16)
+    run(controller, lambda limit: 1000 * limit, steps=5)
+    limit = controller.limit
+    rows = controller.last_status["Innodb_rows_updated"]
+    assert controller.update(elapsed=5, status=status(rows + 10 ** 6, threads=limit * 3)) == limit - 1
+
+
+def test_backs_off_on_rising_lock_waits_at_plateau():
+    controller = AdaptiveController(min_workers=1, max_workers=16)
+    controller.limit = 4
+    controller.update(elapsed=0, status=status(0, threads=5))
+    controller.update(elapsed=5, status=status(5000, threads=5, lock_waits=0))
+    controller.update(elapsed=5, status=status(10000, threads=5, lock_waits=0))
+    limit = controller.limit
+    assert controller.update(elapsed=5, status=status(15000, threads=5, lock_waits=100)) == limit - 1
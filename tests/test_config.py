@@ -0,0 +1,46 @@
+import pytest
+
+pytest.importorskip("podman")
+
+from donky.config import Obfuscators, assign_ports  # noqa: E402
+
+
+def obfuscators(**kwargs) -> Obfuscators:
+    return Obfuscators(
+        db_type="mysql",
+        backup_type="binary",
+        backup_source="/backups",
+        obfuscator="sql",
+        obfuscator_source="/rules",
+        repository="repo",
+        search_name="backup",
+        **kwargs)
+
+
+def test_dump_redacts_transform_key():
+    obfuscator = obfuscators(transforms="users.email = hash", transform_key="secret")
+    dump = obfuscator.dump()
+    assert dump["transform_key"] == "***"
+    assert dump["transforms"] == "users.email = hash"
+    assert "secret" not in repr(obfuscator)
+
+
+def test_transforms_require_key():
+    with pytest.raises(ValueError):
+        obfuscators(transforms="users.email = hash")
+
+
+def test_unknown_storage():
+    with pytest.raises(ValueError):
+        obfuscators(storage="ramdisk")
+
+
+def test_assign_ports_skips_configured_ones():
+    sections = {"a": obfuscators(), "b": obfuscators(port="3306"), "c": obfuscators()}
+    assign_ports(obfuscators=sections)
+    assert [o.port for o in sections.values()] == [3307, 3306, 3308]
+
+
+def test_assign_ports_rejects_shared_port():
+    with pytest.raises(ValueError):
+        assign_ports(obfuscators={"a": obfuscators(port="3310"), "b": obfuscators(port=3310)})
@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip("podman")
+
+from donky.helpers import parse_size, resolve_storage  # noqa: E402
+
+
+@pytest.mark.parametrize("size, expected", [
+    ("1024", 1024),
+    (2048, 2048),
+    ("4K", 4 * 1024),
+    ("1.5g", int(1.5 * 1024 ** 3)),
+    (" 2T ", 2 * 1024 ** 4),
+])
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+@pytest.mark.parametrize("storage", ["disk", "tmpfs"])
+def test_resolve_storage_explicit(storage):
+    assert resolve_storage(storage=storage, restored_size=10 ** 12, memory_budget="1G") == storage
+
+
+def test_resolve_storage_auto_fits_budget():
+    assert resolve_storage(storage="auto", restored_size=600 * 1024 ** 2, memory_budget="1G") == "tmpfs"
+
+
+def test_resolve_storage_auto_keeps_headroom():
+    assert resolve_storage(storage="auto", restored_size=800 * 1024 ** 2, memory_budget="1G") == "disk"
+
+
+@pytest.mark.parametrize("restored_size, memory_budget", [(None, "1G"), (1024, None)])
+def test_resolve_storage_auto_without_sizes(restored_size, memory_budget):
+    assert resolve_storage(storage="auto", restored_size=restored_size, memory_budget=memory_budget) == "disk"
@@ -0,0 +1,116 @@
+import hashlib
+import zlib
+import pytest
+from donky.exceptions import BackupCorruptedError
+from donky.integrity import (
+    CHUNK_EOF,
+    CHUNK_HEADER,
+    CHUNK_PAYLOAD,
+    PAYLOAD_HEADER,
+    XBSTREAM_MAGIC,
+    check_backup_file,
+    check_backup_files,
+    check_chunks,
+    parse_xbstream,
+    split_tasks
+)
+
+
+def chunk(path: bytes, payload: bytes, offset: int = 0) -> bytes:
+    header = CHUNK_HEADER.pack(XBSTREAM_MAGIC, 0, CHUNK_PAYLOAD, len(path)) + path
+    return header + PAYLOAD_HEADER.pack(len(payload), offset, zlib.crc32(payload)) + payload
+
+
+def eof(path: bytes) -> bytes:
+    return CHUNK_HEADER.pack(XBSTREAM_MAGIC, 0, CHUNK_EOF, len(path)) + path
+
+
+def stream() -> bytes:
+    return (
+        chunk(b"ibdata1", b"a" * 100)
+        + chunk(b"db/t.ibd", b"b" * 50)
+        + chunk(b"ibdata1", b"c" * 100, offset=100)
+        + eof(b"ibdata1")
+        + eof(b"db/t.ibd"))
+
+
+@pytest.fixture
+def backup(tmp_path):
+    path = tmp_path / "backup.xbstream"
+    path.write_bytes(stream())
+    return path
+
+
+def test_parse_valid_stream():
+    data = stream()
+    chunks = parse_xbstream(data=data, file="backup")
+    assert len(chunks) == 3
+    assert [c[3] for c in chunks] == [100, 50, 100]
+    assert check_chunks(data=data, chunks=chunks) is None
+
+
+@pytest.mark.parametrize("cut", [5, CHUNK_HEADER.size + 3, 40, 100])
+def test_parse_truncated_stream(cut):
+    with pytest.raises(BackupCorruptedError):
+        parse_xbstream(data=stream()[:-cut], file="backup")
+
+
+def test_parse_bad_magic():
+    data = bytearray(stream())
+    data[0] ^= 0xff
+    with pytest.raises(BackupCorruptedError):
+        parse_xbstream(data=bytes(data), file="backup")
+
+
+def test_check_chunks_bit_flip():
+    data = bytearray(stream())
+    chunks = parse_xbstream(data=bytes(data), file="backup")
+    offset = chunks[1][2] + 10
+    data[offset] ^= 0x01
+    assert check_chunks(data=bytes(data), chunks=chunks) == chunks[1][2]
+
+
+def test_split_tasks():
+    chunks = parse_xbstream(data=stream(), file="backup")
+    assert split_tasks(chunks=chunks, task_size=120) == [chunks[:2], chunks[2:]]
+
+
+def test_check_backup_file(backup):
+    check_backup_file(file=str(backup), format="xbstream", threads=2)
+
+
+def test_check_backup_file_bit_flip(backup):
+    data = bytearray(backup.read_bytes())
+    data[-60] ^= 0x01
+    backup.write_bytes(bytes(data))
+    with pytest.raises(BackupCorruptedError):
+        check_backup_file(file=str(backup), format="xbstream", threads=2)
+
+
+def test_check_backup_file_empty(tmp_path):
+    path = tmp_path / "empty.xbstream"
+    path.write_bytes(b"")
+    with pytest.raises(BackupCorruptedError):
+        check_backup_file(file=str(path), format="xbstream")
+
+
+def test_sidecar_checksum(backup):
+    sidecar = backup.parent / f"{backup.name}.sha256"
+    sidecar.write_text(f"{hashlib.sha256(backup.read_bytes()).hexdigest()}  {backup.name}\n")
+    check_backup_file(file=str(backup), format="xbstream")
+    sidecar.write_text(f"{'0' * 64}  {backup.name}\n")
+    with pytest.raises(BackupCorruptedError):
+        check_backup_file(file=str(backup), format="xbstream")
+
+
+def test_empty_sidecar(backup):
+    (backup.parent / f"{backup.name}.md5").write_text("")
+    with pytest.raises(BackupCorruptedError):
+        check_backup_file(file=str(backup), format="xbstream")
+
+
+def test_check_backup_files_cache(backup, tmp_path):
+    cache = tmp_path / "checks.json"
+    check_backup_files(files=[str(backup)], format="xbstream", cache_file=str(cache))
+    assert str(backup) in cache.read_text()
+    check_backup_files(files=[str(backup)], format="xbstream", cache_file=str(cache))
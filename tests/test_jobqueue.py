@@ -0,0 +1,135 @@
+import time
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("pymysql")
+pytest.importorskip("podman")
+
+from donky.exceptions import LeakDetectedError, LeaseLostError  # noqa: E402
+import donky.jobqueue  # noqa: E402
+from donky.jobqueue import JobQueue, Worker  # noqa: E402
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(path=str(tmp_path / "queue.db"), lease=1, max_attempts=2)
+
+
+def expire(queue: JobQueue, job_id: int) -> None:
+    with queue._transaction() as conn:
+        conn.execute("UPDATE jobs SET lease_until = ? WHERE id = ?", (time.time() - 1, job_id))
+
+
+def test_submit_deduplicates(queue):
+    first = queue.submit(kind="obfuscate", section="a", payload={"verify": True})
+    assert queue.submit(kind="obfuscate", section="a", payload={"verify": True}) == first
+    assert queue.submit(kind="obfuscate", section="a") != first
+    with pytest.raises(ValueError):
+        queue.submit(kind="unknown", section="a")
+
+
+def test_claim_returns_updated_job(queue):
+    job_id = queue.submit(kind="obfuscate", section="a", payload={"verify": True})
+    job = queue.claim(worker="w1", sections=["a"])
+    assert job["id"] == job_id
+    assert job["worker"] == "w1"
+    assert job["state"] == "running"
+    assert job["attempts"] == 1
+    assert job["payload"] == {"verify": True}
+    assert queue.claim(worker="w2", sections=["a"]) is None
+
+
+def test_claim_filters_sections(queue):
+    queue.submit(kind="obfuscate", section="a")
+    assert queue.claim(worker="w1", sections=["b"]) is None
+
+
+def test_lease_takeover(queue):
+    job_id = queue.submit(kind="obfuscate", section="a")
+    queue.claim(worker="w1", sections=["a"])
+    expire(queue=queue, job_id=job_id)
+    job = queue.claim(worker="w2", sections=["a"])
+    assert job["worker"] == "w2"
+    assert job["attempts"] == 2
+    assert not queue.heartbeat(job_id=job_id, worker="w1")
+    assert queue.heartbeat(job_id=job_id, worker="w2")
+    with pytest.raises(LeaseLostError):
+        queue.complete(job_id=job_id, worker="w1")
+    assert not queue.fail(job_id=job_id, worker="w1", error="late")
+    queue.complete(job_id=job_id, worker="w2")
+    assert queue.jobs()[0]["state"] == "done"
+
+
+def test_complete_refused_after_lease_expired(queue):
+    job_id = queue.submit(kind="obfuscate", section="a")
+    queue.claim(worker="w1", sections=["a"])
+    expire(queue=queue, job_id=job_id)
+    with pytest.raises(LeaseLostError):
+        queue.complete(job_id=job_id, worker="w1")
+
+
+def test_attempts_exhausted_on_expired_lease(queue):
+    job_id = queue.submit(kind="obfuscate", section="a")
+    for worker in ("w1", "w2"):
+        queue.claim(worker=worker, sections=["a"])
+        expire(queue=queue, job_id=job_id)
+    assert queue.claim(worker="w3", sections=["a"]) is None
+    job = queue.jobs()[0]
+    assert job["state"] == "failed"
+    assert "2 attempts" in job["error"]
+
+
+def test_fail_requeues_until_attempts_exhausted(queue):
+    job_id = queue.submit(kind="obfuscate", section="a")
+    queue.claim(worker="w1", sections=["a"])
+    assert queue.fail(job_id=job_id, worker="w1", error="boom")
+    assert queue.jobs()[0]["state"] == "pending"
+    queue.claim(worker="w1", sections=["a"])
+    assert queue.fail(job_id=job_id, worker="w1", error="boom")
+    assert queue.jobs()[0]["state"] == "failed"
+
+
+def test_worker_aborts_job_on_lost_lease(queue):
+    queue.submit(kind="obfuscate", section="a")
+
+    class SlowWorker(Worker):
+        def run_job(self, job: dict) -> None:
+            time.sleep(10)
+
+    queue.heartbeat = lambda job_id, worker: False
+    worker = SlowWorker(config=None, queue=queue, sections=["a"])
+    start = time.monotonic()
+    worker.run(exit_when_empty=True)
+    assert time.monotonic() - start < 5
+    assert queue.jobs()[0]["state"] != "done"
+
+
+class FakeContainer():
+    stopped = False
+
+    def stop(self) -> None:
+        self.stopped = True
+
+
+class FakeObfuscator():
+    def __init__(self, leaked: dict):
+        self.leaked = leaked
+
+    def verify(self) -> dict:
+        return self.leaked
+
+
+@pytest.mark.parametrize("leaked", [{}, {"db.users": 1}])
+def test_run_job_stops_mysql_container(queue, monkeypatch, leaked):
+    container = FakeContainer()
+    config = type("Config", (), {"obfuscators": {"a": {}}})()
+    monkeypatch.setattr(donky.jobqueue, "run_obfuscator", lambda config, name, obfuscator: container)
+    monkeypatch.setattr(donky.jobqueue, "init_obfuscator", lambda config, name, obfuscator: FakeObfuscator(leaked))
+    worker = Worker(config=config, queue=queue, sections=["a"])
+    job = {"section": "a", "payload": {"verify": True}}
+    if leaked:
+        with pytest.raises(LeakDetectedError):
+            worker.run_job(job=job)
+    else:
+        worker.run_job(job=job)
+    assert container.stopped
@@ -0,0 +1,111 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from donky.planner import (  # noqa: E402
+    Plan,
+    PlannedStatement,
+    StatementGroup,
+    group_statements,
+    merge_small_groups,
+    predict_wall_time,
+    split_phases,
+    statement_tables
+)
+
+
+@pytest.mark.parametrize("query, tables", [
+    ("UPDATE db.users SET name = 'x'", ["db.users"]),
+    ("UPDATE IGNORE db.users SET name = 'x'", ["db.users"]),
+    ("UPDATE LOW_PRIORITY `db`.`users` u JOIN orders o ON o.user_id = u.id SET u.name = o.name", ["db.users", "orders"]),
+    ("UPDATE db.a, db.b SET a.x = b.y WHERE a.id = b.id", ["db.a", "db.b"]),
+    ("UPDATE t SET note = 'copied from secret' WHERE c = \"join other\"", ["t"]),
+    ("DELETE QUICK IGNORE FROM t WHERE id IN (SELECT id FROM s)", ["t", "s"]),
+    ("DELETE t1, t2 FROM t1 JOIN t2 ON t1.id = t2.id", ["t1", "t2"]),
+    ("INSERT IGNORE INTO t (a) SELECT a FROM s AS x", ["t", "s"]),
+    ("TRUNCATE TABLE t", ["t"]),
+    ("UPDATE t /* from hidden */ SET a = 1", ["t"]),
+])
+def test_statement_tables(query, tables):
+    assert statement_tables(query) == tables
+
+
+@pytest.mark.parametrize("query", [
+    "SET @salt = 'x'",
+    "WITH c AS (SELECT id FROM t) UPDATE t JOIN c USING (id) SET a = 1",
+    "CALL obfuscate()",
+])
+def test_statement_tables_not_confident(query):
+    assert statement_tables(query) is None
+
+
+def statement(position: int, tables: list, cost: float = 1.0) -> PlannedStatement:
+    return PlannedStatement(query=f"q{position}", position=position, tables=tables or [], barrier=tables is None, cost=cost)
+
+
+def test_group_statements_joins_shared_tables():
+    groups = group_statements([statement(0, ["a"]), statement(1, ["b"]), statement(2, ["a", "c"]), statement(3, ["c"])])
+    assert sorted([s.position for s in g.statements] for g in groups) == [[0, 2, 3], [1]]
+
+
+def test_split_phases_at_barriers():
+    phases = split_phases([statement(0, ["a"]), statement(1, None), statement(2, ["a"]), statement(3, ["b"])])
+    assert [[s.position for s in p] for p in phases] == [[0], [1], [2, 3]]
+
+
+def test_plan_groups_and_wall_time():
+    phases = [group_statements([statement(0, ["a"], 3.0), statement(1, ["b"], 1.0)]), group_statements([statement(2, None, 2.0)])]
+    plan = Plan(
+        phases=phases,
+        workers=2,
+        wall_time=sum(predict_wall_time(groups=p, workers=2) for p in phases),
+        serial_time=6.0)
+    assert len(plan.groups) == 3
+    assert plan.wall_time == 5.0
+
+
+def dml(position: int, table: str, cost: float = 0.1) -> PlannedStatement:
+    return PlannedStatement(query=f"UPDATE {table} SET a = {position}", position=position, tables=[table], cost=cost)
+
+
+def test_batches_group_small_dml():
+    group = StatementGroup(statements=[dml(i, "t") for i in range(5)])
+    assert [len(b) for b in group.batches(batch_size=2, max_cost=1.0)] == [2, 2, 1]
+    assert [len(b) for b in group.batches(batch_size=1, max_cost=1.0)] == [1] * 5
+
+
+def test_batches_run_costly_and_ddl_alone():
+    statements = [
+        dml(0, "t"),
+        dml(1, "t"),
+        PlannedStatement(query="TRUNCATE TABLE t", position=2, tables=["t"]),
+        dml(3, "t"),
+        dml(4, "t", cost=5.0),
+        dml(5, "t"),
+        PlannedStatement(query="ALTER TABLE t ADD c INT", position=6, tables=["t"]),
+        statement(7, None, 0.0),
+    ]
+    batches = StatementGroup(statements=statements).batches(batch_size=10, max_cost=1.0)
+    assert batches == [
+        [statements[0].query, statements[1].query],
+        ["TRUNCATE TABLE t"],
+        [statements[3].query],
+        [statements[4].query],
+        [statements[5].query],
+        ["ALTER TABLE t ADD c INT"],
+        ["q7"],
+    ]
+
+
+def test_merge_small_groups():
+    groups = [
+        StatementGroup(statements=[dml(0, "a")]),
+        StatementGroup(statements=[dml(1, "b", cost=5.0)]),
+        StatementGroup(statements=[dml(2, "c")]),
+        StatementGroup(statements=[PlannedStatement(query="TRUNCATE TABLE d", position=3, tables=["d"])]),
+        StatementGroup(statements=[dml(4, "e")]),
+    ]
+    merged = merge_small_groups(groups=groups, batch_size=2, max_cost=1.0)
+    assert sorted([s.position for s in g.statements] for g in merged) == [[0, 2], [1], [3], [4]]
+    assert merged[0].cost == 5.0
+    assert merge_small_groups(groups=groups, batch_size=1, max_cost=1.0) is groups
@@ -0,0 +1,122 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("yaml")
+
+from donky.rules import check_overlap, compile_column, compile_rules, derive_salt, load_rules  # noqa: E402
+from donky.transforms import parse_rules  # noqa: E402
+
+RULES = """
+tables:
+  db.users:
+    where: active = 1
+    columns:
+      created:
+        transform: date_shift
+        entity: id
+        days: 10
+      id:
+        transform: set
+        value: 0
+      email:
+        transform: email
+        domain: test.local
+      note:
+"""
+
+
+@pytest.fixture
+def rules(tmp_path):
+    path = tmp_path / "rules.yaml"
+    path.write_text(RULES)
+    return load_rules(path=str(path))
+
+
+def test_load_rules(rules):
+    columns = rules["db.users"]["columns"]
+    assert rules["db.users"]["where"] == "active = 1"
+    assert columns["note"]["transform"] == "null"
+    assert columns["email"] == {"transform": "email", "domain": "test.local"}
+
+
+def test_load_rules_unknown_transform(tmp_path):
+    path = tmp_path / "rules.yaml"
+    path.write_text("tables:\n  db.users:\n    columns:\n      email: scramble\n")
+    with pytest.raises(ValueError):
+        load_rules(path=str(path))
+
+
+def test_compile_rules_one_update_per_table(rules):
+    statements = compile_rules(rules=rules, salt="s")
+    assert len(statements) == 1
+    assert statements[0].startswith("UPDATE `db`.`users` SET\n")
+    assert statements[0].endswith("\nWHERE active = 1")
+
+
+def test_compile_rules_assigns_entity_last(rules):
+    statement = compile_rules(rules=rules, salt="s")[0]
+    assignments = [line.strip() for line in statement.splitlines()[1:-1]]
+    assert [a.split(" ")[0] for a in assignments] == ["`created`", "`email`", "`note`", "`id`"]
+    assert "CRC32(CONCAT('s', `id`))" in assignments[0]
+
+
+def test_compile_rules_exclude(rules):
+    statement = compile_rules(rules=rules, exclude={"db.users": "`id` BETWEEN 0 AND 9"}, salt="s")[0]
+    assert statement.endswith("\nWHERE (active = 1) AND (NOT (`id` BETWEEN 0 AND 9))")
+    assert compile_rules(rules=rules, exclude={"db.users": "1=1"}, salt="s") == []
+
+
+def test_compile_column_keeps_nulls():
+    assert compile_column(column="email", rule={"transform": "hash", "length": 8}, salt="s") == \
+        "`email` = IF(`email` IS NULL, NULL, LEFT(SHA2(CONCAT('s', `email`), 256), 8))"
+    assert compile_column(column="note", rule={"transform": "null"}) == "`note` = NULL"
+    assert compile_column(column="name", rule={"transform": "set", "value": "it's"}) == "`name` = 'it\\'s'"
+
+
+def test_compile_column_requires_salt():
+    for transform in ("hash", "email", "date_shift"):
+        with pytest.raises(ValueError):
+            compile_column(column="c", rule={"transform": transform})
+        with pytest.raises(ValueError):
+            compile_column(column="c", rule={"transform": transform, "salt": ""})
+    assert "CONCAT('own', `c`)" in compile_column(column="c", rule={"transform": "hash", "salt": "own"}, salt="s")
+    assert compile_column(column="c", rule={"transform": "digits"}).count("REPLACE(") == 10
+
+
+def test_compile_rules_requires_salt(rules):
+    with pytest.raises(ValueError):
+        compile_rules(rules=rules)
+
+
+def test_derive_salt():
+    salt = derive_salt(key="secret")
+    assert salt == derive_salt(key="secret")
+    assert salt != derive_salt(key="other")
+    assert "secret" not in salt
+    assert derive_salt(key=None) is None
+
+
+def test_compile_digits_without_regexp():
+    assignment = compile_column(column="phone", rule={"transform": "digits", "mask": "x"})
+    assert "REGEXP" not in assignment
+    assert assignment.count("REPLACE(") == 10
+
+
+def test_check_overlap(rules):
+    check_overlap(rules=rules, transforms=parse_rules(spec="users.phone = digits"))
+    with pytest.raises(ValueError):
+        check_overlap(rules=rules, transforms=parse_rules(spec="users.email = hash"))
+    with pytest.raises(ValueError):
+        check_overlap(rules=rules, transforms=parse_rules(spec="db.users.note = hash"))
+
+
+def test_compile_rules_exclude_without_where():
+    rules = {
+        "db.a": {"where": None, "columns": {"x": {"transform": "null"}}},
+        "db.b": {"where": None, "columns": {"y": {"transform": "null"}}},
+    }
+    statements = compile_rules(rules=rules, exclude={"db.a": "`id` BETWEEN 0 AND 9"})
+    assert statements == [
+        "UPDATE `db`.`a` SET\n    `x` = NULL\nWHERE NOT (`id` BETWEEN 0 AND 9)",
+        "UPDATE `db`.`b` SET\n    `y` = NULL",
+    ]
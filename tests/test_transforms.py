@@ -0,0 +1,118 @@
+import datetime
+import numpy
+import pytest
+from donky.transforms import (
+    date_shift,
+    digit_mask,
+    hash_values,
+    keyed_hash,
+    nullify,
+    parse_rules,
+    substitute,
+    transform_batch
+)
+
+KEY = "secret"
+
+
+def test_hash_values_same_across_batch_width():
+    narrow = hash_values(values=numpy.array(["ab", "cd"], dtype=object), key=KEY)
+    wide = hash_values(values=numpy.array(["ab", "a much longer value", "cd"], dtype=object), key=KEY)
+    assert narrow[0] == wide[0]
+    assert narrow[1] == wide[2]
+
+
+def test_hash_values_depend_on_key_and_seed():
+    values = numpy.array(["ab"], dtype=object)
+    base = hash_values(values=values, key=KEY, seed="0")
+    assert base[0] != hash_values(values=values, key="other", seed="0")[0]
+    assert base[0] != hash_values(values=values, key=KEY, seed="1")[0]
+
+
+def test_hash_values_distinguish_trailing_characters():
+    h = hash_values(values=numpy.array(["a", "a ", "ab"], dtype=object), key=KEY)
+    assert len(set(h.tolist())) == 3
+
+
+@pytest.mark.parametrize("transform", [keyed_hash, digit_mask])
+def test_transform_same_across_batch_width(transform):
+    narrow = transform(numpy.array(["+370 600 12345"], dtype=object), KEY, "0", {})
+    wide = transform(numpy.array(["1", "+370 600 12345", "a" * 40], dtype=object), KEY, "0", {})
+    assert narrow[0] == wide[1]
+
+
+@pytest.mark.parametrize("transform", [keyed_hash, digit_mask])
+def test_transform_keeps_nulls(transform):
+    result = transform(numpy.array(["123", None, "456"], dtype=object), KEY, "0", {})
+    assert result[1] is None
+    assert result[0] is not None and result[2] is not None
+
+
+def test_keyed_hash_is_hex():
+    result = keyed_hash(numpy.array(["john@example.com"], dtype=object), KEY, "0", {})
+    assert len(result[0]) == 16
+    int(result[0], 16)
+
+
+def test_digit_mask_keeps_format():
+    result = digit_mask(numpy.array(["+370 (600) 12-345"], dtype=object), KEY, "0", {})
+    assert len(result[0]) == len("+370 (600) 12-345")
+    assert [c for c in result[0] if not c.isdigit()] == [c for c in "+370 (600) 12-345" if not c.isdigit()]
+
+
+def test_date_shift_keeps_entity_intervals():
+    dates = numpy.array([datetime.datetime(2020, 1, 1), datetime.datetime(2020, 1, 11), None], dtype=object)
+    batch = {"user_id": numpy.array([7, 7, 7], dtype=object)}
+    result = date_shift(dates, KEY, "0", batch, "user_id", "30")
+    assert result[2] is None
+    assert result[1] - result[0] == datetime.timedelta(days=10)
+    assert abs(result[0] - datetime.datetime(2020, 1, 1)) <= datetime.timedelta(days=30)
+
+
+def test_nullify():
+    result = nullify(numpy.array(["a", None], dtype=object), KEY, "0", {})
+    assert result.tolist() == [None, None]
+
+
+def test_substitute_picks_dictionary_words(tmp_path):
+    dictionary = tmp_path / "names.txt"
+    dictionary.write_text("Alice\nBob\n\nCarol\n")
+    values = numpy.array(["john", None, "john"], dtype=object)
+    result = substitute(values, KEY, "0", {}, str(dictionary))
+    assert result[0] in ("Alice", "Bob", "Carol")
+    assert result[0] == result[2]
+    assert result[1] is None
+
+
+def test_parse_rules():
+    rules = parse_rules(spec="db.users.email = hash\nusers.phone = digits, orders.created = date_shift:user_id:10")
+    assert [(r.table, r.column, r.transform, r.args) for r in rules] == [
+        ("db.users", "email", "hash", []),
+        ("users", "phone", "digits", []),
+        ("orders", "created", "date_shift", ["user_id", "10"]),
+    ]
+
+
+@pytest.mark.parametrize("spec", ["email = hash", "users.email = unknown"])
+def test_parse_rules_rejects_bad_entries(spec):
+    with pytest.raises(ValueError):
+        parse_rules(spec=spec)
+
+
+def test_transform_batch_matches_full_and_bare_table_name():
+    rules = parse_rules(spec="users.email = null, db.users.phone = null, db.orders.note = null")
+    batch = {
+        "email": numpy.array(["a@b.c"], dtype=object),
+        "phone": numpy.array(["123"], dtype=object),
+        "name": numpy.array(["John"], dtype=object),
+    }
+    result = transform_batch(table="db.users", batch=batch, rules=rules, key=KEY)
+    assert result["email"][0] is None
+    assert result["phone"][0] is None
+    assert result["name"][0] == "John"
+
+
+def test_transform_batch_missing_column():
+    rules = parse_rules(spec="users.email = hash")
+    with pytest.raises(ValueError):
+        transform_batch(table="db.users", batch={"name": numpy.array(["x"], dtype=object)}, rules=rules, key=KEY)
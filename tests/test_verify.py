@@ -0,0 +1,80 @@
+import numpy
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from donky.verify import BloomFilter, sensitive_columns  # noqa: E402
+
+
+def values(start: int, count: int) -> numpy.ndarray:
+    return numpy.array([f"user{i}@example.com" for i in range(start, start + count)], dtype=object)
+
+
+def test_bloom_contains_added_values():
+    bloom = BloomFilter(capacity=1000, key="k")
+    bloom.add(values(0, 1000))
+    assert bloom.contains(values(0, 1000)).all()
+
+
+def test_bloom_false_positive_rate():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01, key="k")
+    bloom.add(values(0, 1000))
+    assert bloom.contains(values(1000, 10000)).mean() < 0.03
+
+
+def test_bloom_empty_batches():
+    bloom = BloomFilter(capacity=10, key="k")
+    bloom.add(numpy.array([], dtype=object))
+    assert len(bloom.contains(numpy.array([], dtype=object))) == 0
+
+
+def test_bloom_save_load_round_trip(tmp_path):
+    bloom = BloomFilter(capacity=1000, key="k")
+    bloom.add(values(0, 1000))
+    path = str(tmp_path / "filter.bloom")
+    bloom.save(path=path)
+    loaded = BloomFilter.load(path=path)
+    assert loaded.key == bloom.key
+    assert loaded.hashes == bloom.hashes
+    assert loaded.size == bloom.size
+    numpy.testing.assert_array_equal(loaded.contains(values(0, 2000)), bloom.contains(values(0, 2000)))
+
+
+def test_bloom_key_changes_positions():
+    first = BloomFilter(capacity=100, key="a")
+    second = BloomFilter(capacity=100, key="b")
+    first.add(values(0, 100))
+    second.add(values(0, 100))
+    assert not numpy.array_equal(first.bits, second.bits)
+
+
+def test_sensitive_columns_from_verify_columns():
+    columns = sensitive_columns(verify_columns="db.users.email,\ndb.users.phone", transforms="users.name = hash")
+    assert columns == [("db.users", "email"), ("db.users", "phone")]
+
+
+def test_sensitive_columns_fallback_to_transforms_and_rules():
+    rules = {"db.users": {"where": None, "columns": {"email": {"transform": "hash"}, "phone": {"transform": "digits"}}}}
+    columns = sensitive_columns(transforms="db.users.email = hash", rules=rules)
+    assert columns == [("db.users", "email"), ("db.users", "phone")]
+
+
+def test_sensitive_columns_rejects_bare_column():
+    with pytest.raises(ValueError):
+        sensitive_columns(verify_columns="email")
+
+
+def test_bloom_skips_values_longer_than_sampled():
+    bloom = BloomFilter(capacity=100, key="k")
+    bloom.add(values(0, 100))
+    assert bloom.max_length == len("user99@example.com")
+    mixed = numpy.array(["user1@example.com", "x" * 100000, None], dtype=object)
+    assert bloom.contains(mixed[:2]).tolist() == [True, False]
+
+
+def test_bloom_save_load_keeps_max_length(tmp_path):
+    bloom = BloomFilter(capacity=10, key="k")
+    bloom.add(numpy.array(["abc"], dtype=object))
+    path = str(tmp_path / "filter.bloom")
+    bloom.save(path=path)
+    assert BloomFilter.load(path=path).max_length == 3